@@ -0,0 +1,187 @@
+"""Running HR analytics over interview reports.
+
+Every ``InterviewReport.create`` folds the new report into a few small
+documents in the ``analytics`` collection, one for all reports and one per
+role, so the dashboard's statistics cost a handful of reads however many
+reports exist. Each document holds the report count, score sum, a score
+histogram, reports per day, and the most frequent weaknesses. Weaknesses
+are counted with the Space-Saving algorithm: at most TOP_K counters, and
+any weakness mentioned in more than 1/TOP_K of the reports is guaranteed
+to be among them (``error`` bounds how much its count may be overstated).
+
+``rebuild(db)`` recomputes everything from the reports themselves.
+"""
+import datetime
+import time
+
+from . import log
+from .db import DuplicateKeyError
+
+# Weakness counters kept per scope
+TOP_K = 50
+# Days of per-day counts kept
+DAYS = 365
+HISTOGRAM_BUCKETS = 10
+# Attempts at an update when other writers keep getting in first
+MAX_RETRIES = 10
+# Seconds a folded report's id is remembered, so it is never counted twice
+RECENT_SECONDS = 600
+
+def _scopes(report):
+    return ["all", "role:" + str(report.get("role") or "Unknown")]
+
+def _empty(scope):
+    return {
+        "_id": scope,
+        "count": 0,
+        "score_sum": 0,
+        "score_min": None,
+        "score_max": None,
+        "histogram": [0] * HISTOGRAM_BUCKETS,
+        "per_day": {},
+        "weaknesses": {},
+        "reports_seen": 0,
+        "recent": {},
+        "_rev": 0
+    }
+
+def _normalize(text):
+    return " ".join(str(text).lower().split())
+
+def _day(report):
+    created_at = report.get("created_at") or time.time()
+    return datetime.datetime.fromtimestamp(created_at, datetime.timezone.utc).strftime("%Y-%m-%d")
+
+def _fold(stats, report):
+    """Add one report to ``stats`` in place."""
+    score = report.get("score")
+    stats["count"] += 1
+    if isinstance(score, (int, float)) and not isinstance(score, bool):
+        score = max(0, min(100, score))
+        stats["score_sum"] += score
+        stats["score_min"] = score if stats["score_min"] is None else min(stats["score_min"], score)
+        stats["score_max"] = score if stats["score_max"] is None else max(stats["score_max"], score)
+        stats["histogram"][min(int(score) * HISTOGRAM_BUCKETS // 100, HISTOGRAM_BUCKETS - 1)] += 1
+        stats["reports_seen"] += 1
+
+    per_day = stats["per_day"]
+    day = _day(report)
+    per_day[day] = per_day.get(day, 0) + 1
+    if len(per_day) > DAYS:
+        for old in sorted(per_day)[:len(per_day) - DAYS]:
+            del per_day[old]
+
+    # Space-Saving: a new item takes over the smallest counter once all are in use
+    counters = stats["weaknesses"]
+    for weakness in {_normalize(w) for w in report.get("weaknesses") or [] if str(w).strip()}:
+        if weakness in counters:
+            counters[weakness][0] += 1
+        elif len(counters) < TOP_K:
+            counters[weakness] = [1, 0]
+        else:
+            smallest = min(counters, key=lambda w: counters[w][0])
+            floor = counters.pop(smallest)[0]
+            counters[weakness] = [floor + 1, floor]
+
+    # A rebuild may count a report between its insert and its record_report
+    now = time.time()
+    recent = {k: t for k, t in stats.get("recent", {}).items() if t >= now - RECENT_SECONDS}
+    created_at = report.get("created_at") or now
+    if "_id" in report and created_at >= now - RECENT_SECONDS:
+        recent[str(report["_id"])] = created_at
+    stats["recent"] = recent
+    return stats
+
+def record_report(db, report):
+    """Fold a newly created report into the stored aggregates."""
+    for scope in _scopes(report):
+        for _ in range(MAX_RETRIES):
+            stats = db.analytics.find_one({"_id": scope})
+            if stats is None:
+                try:
+                    db.analytics.insert_one(_fold(_empty(scope), report))
+                    break
+                except DuplicateKeyError:
+                    continue
+            if str(report.get("_id")) in stats.get("recent", {}):
+                # A rebuild already counted it
+                break
+            rev = stats.pop("_rev", 0)
+            stats.pop("_id")
+            # Only lands if nobody else updated the scope since we read it
+            if db.analytics.update_one({"_id": scope, "_rev": rev},
+                                       {"$set": _fold(stats, report), "$inc": {"_rev": 1}}):
+                break
+        else:
+            log.warning("analytics", "update gave up", scope=scope, conflicts=MAX_RETRIES)
+
+def rebuild(db):
+    """Recompute all aggregates from the reports; returns the number of reports read.
+
+    Safe to run while the app is serving: each scope is swapped in with a
+    conditional update, and the rebuild starts over if a report was folded
+    into any scope since it began. Reports it counts keep their ids in
+    ``recent`` for a while, so a ``record_report`` still on its way for one
+    of them does not count it again.
+    """
+    fields = {"role": 1, "score": 1, "weaknesses": 1, "created_at": 1}
+    for _ in range(MAX_RETRIES):
+        seen = {doc["_id"]: doc.get("_rev", 0) for doc in db.analytics.find(projection={"_rev": 1})}
+        scopes = {}
+        reports = db.reports.find(projection=fields, sort="created_at")
+        for report in reports:
+            for scope in _scopes(report):
+                _fold(scopes.setdefault(scope, _empty(scope)), report)
+        if _swap(db, seen, scopes):
+            return len(reports)
+    raise RuntimeError(f"Analytics changed during each of {MAX_RETRIES} rebuild attempts")
+
+def _swap(db, seen, scopes):
+    """Replace the stored scopes read at revisions ``seen``; False if any has moved on."""
+    for scope, stats in scopes.items():
+        if scope not in seen:
+            try:
+                db.analytics.insert_one(stats)
+            except DuplicateKeyError:
+                return False
+            continue
+        values = {k: v for k, v in stats.items() if k not in ("_id", "_rev")}
+        if not db.analytics.update_one({"_id": scope, "_rev": seen[scope]}, {"$set": values, "$inc": {"_rev": 1}}):
+            return False
+    # Scopes no report maps to any more (e.g. reports deleted), unless one just arrived
+    for scope, rev in seen.items():
+        if scope not in scopes:
+            db.analytics.delete_many({"_id": scope, "_rev": rev})
+    return True
+
+def summary(stats, top=10):
+    """The public view of one scope's aggregates."""
+    counters = stats["weaknesses"]
+    ranked = sorted(counters, key=lambda w: counters[w][0], reverse=True)[:top]
+    size = 100 // HISTOGRAM_BUCKETS
+    return {
+        "count": stats["count"],
+        "average_score": round(stats["score_sum"] / stats["reports_seen"], 1) if stats["reports_seen"] else None,
+        "min_score": stats["score_min"],
+        "max_score": stats["score_max"],
+        "score_histogram": [
+            {"range": f"{i * size}-{100 if i == HISTOGRAM_BUCKETS - 1 else (i + 1) * size - 1}", "count": n}
+            for i, n in enumerate(stats["histogram"])
+        ],
+        "per_day": dict(sorted(stats["per_day"].items())),
+        "top_weaknesses": [
+            {"weakness": w, "count": counters[w][0], "error": counters[w][1]} for w in ranked
+        ]
+    }
+
+def get_summary(db, role=None):
+    if role:
+        stats = db.analytics.find_one({"_id": "role:" + role})
+        return {"role": role, **summary(stats or _empty(role))}
+    docs = {doc["_id"]: doc for doc in db.analytics.find()}
+    return {
+        "overall": summary(docs.get("all") or _empty("all")),
+        "roles": {
+            _id[len("role:"):]: summary(doc) for _id, doc in sorted(docs.items()) if _id.startswith("role:")
+        }
+    }
@@ -1,4 +1,4 @@
-from flask import Flask, render_template, send_from_directory, session
+from flask import Flask, render_template, send_from_directory, session, request
 import os
 
 app = Flask(__name__, template_folder='templates', static_folder='static')
@@ -7,6 +7,10 @@ app = Flask(__name__, template_folder='templates', static_folder='static')
 app.config['SECRET_KEY'] = 'dev-secret'
 app.config['MONGO_URI'] = os.getenv('MONGO_URI', 'mongodb://localhost:27017/ai_interviewer')
 
+# Refuse oversized bodies before reading them; resume uploads are the largest we accept
+from .resume import RESUME_MAX_BYTES
+app.config['MAX_CONTENT_LENGTH'] = RESUME_MAX_BYTES + 1024 * 1024
+
 # Routes / Blueprints
 # Routes / Blueprints
 from .routes.hr_roles import hr_roles_bp
@@ -15,6 +19,7 @@ from .routes.hr_auth import hr_auth_bp
 from .routes.hr_dashboard import hr_dashboard_bp
 from .routes.auth import auth_bp
 from .routes.interview_api import interview_api_bp
+from .routes.setup_bot import setup_bot_bp
 from flask_login import LoginManager, login_required, current_user
 from .models import User
 from .db import get_db
@@ -34,6 +39,21 @@ app.register_blueprint(hr_auth_bp)
 app.register_blueprint(hr_dashboard_bp)
 app.register_blueprint(auth_bp)
 app.register_blueprint(interview_api_bp)
+app.register_blueprint(setup_bot_bp)
+
+# Per-request profiles on demand (PROFILE_TOKEN), then request timing and /metrics (METRICS=off to disable)
+from . import metrics, profiling
+profiling.init_app(app)
+metrics.init_app(app)
+
+# Background workers (report generation etc.), started per process on its first request
+from . import jobs
+jobs.init_app(app)
+
+# SDKs and parsers load on first use unless APP_PRELOAD=1
+from . import warmup
+if warmup.APP_PRELOAD:
+    warmup.preload()
 
 # Frontend Routes (Pages)
 @app.route('/')
@@ -53,6 +73,20 @@ def interview_page():
 @app.route('/report')
 @login_required
 def report_page():
+    job_id = request.args.get('job')
+    if job_id:
+        from .models import Job, InterviewReport
+        db = get_db()
+        job = Job.get_by_id(db, job_id)
+        if not job or job.get('owner') != current_user.id:
+            return render_template('report.html', user=current_user, report={})
+        if job['status'] == 'done':
+            session['report_data'] = InterviewReport.get_by_id(db, job['result']['report_id']) or {}
+        elif job['status'] == 'failed':
+            return render_template('report.html', user=current_user, report={}, job_error=job['error'])
+        else:
+            # Still generating; the page polls the job and reloads
+            return render_template('report.html', user=current_user, report={}, job=job_id)
     report_data = session.get('report_data', {})
     return render_template('report.html', user=current_user, report=report_data)
 
@@ -0,0 +1,159 @@
+"""Bounded model context for long interviews.
+
+Sending the whole transcript every turn makes input tokens grow linearly per
+turn and quadratically per interview. Instead each call carries the cached
+prompt prefix (see ``llm.Context``), a running summary of older turns, and
+the most recent turns verbatim, within a token budget.
+
+The summary lives on the active interview (``summary`` covering the first
+``summarized`` turns) and is brought up to date in the background, a batch
+of turns at a time, after a turn is saved.
+
+Stats hooks registered with ``add_stats_hook`` are called as
+``hook(event, stats)``: ``"turn"`` for every model call and ``"end"`` with
+the interview's totals when it finishes.
+"""
+import os
+import threading
+
+from . import llm, log, ratelimit
+
+# Most recent exchanges (answer + reply) always sent verbatim
+CONTEXT_TURNS = int(os.getenv("CONTEXT_TURNS", "6"))
+# Token budget for the summary and turns sent after the prompt prefix
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# Summarize once this many turns have fallen out of the window unsummarized
+SUMMARY_BATCH = 4
+
+SUMMARY_PROMPT = """You keep notes for an interviewer. Update the summary of the interview so far with the new exchanges below.
+Keep the topics covered, the candidate's claims and examples, strengths, weak spots and open follow-ups.
+Reply with the updated summary only, in at most {words} words.
+
+Summary so far:
+{summary}
+
+New exchanges:
+{exchanges}
+"""
+
+_stats_hooks = []
+
+def add_stats_hook(hook):
+    _stats_hooks.append(hook)
+
+def _emit(event, stats):
+    for hook in _stats_hooks:
+        try:
+            hook(event, stats)
+        except Exception as e:
+            log.error("conversation", "stats hook failed", error=str(e))
+
+def _tokens(messages):
+    return ratelimit.estimate_tokens(messages)
+
+def _window_start(turns, keep):
+    # Start on a model turn so roles keep alternating after the prompt
+    start = max(len(turns) - 2 * keep - 1, 0)
+    if start and turns[start]["role"] != "model":
+        start += 1
+    return start
+
+def build(interview, turns, budget=None, keep=None):
+    """Messages to send after the prompt prefix for ``turns``, and the tokens this saved.
+
+    ``turns`` is the stored transcript after the prompt, including the new
+    answer. The last ``keep`` exchanges are always sent; older unsummarized
+    turns are added newest first while they fit the budget.
+    """
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    keep = CONTEXT_TURNS if keep is None else keep
+
+    summary = interview.get("summary")
+    summarized = interview.get("summarized") or 0
+    start = max(_window_start(turns, keep), summarized)
+    head = [{"role": "user", "parts": ["Summary of the interview so far:\n" + summary]}] if summary else []
+
+    used = _tokens(head + turns[start:])
+    # Pull in turns the summary does not cover yet, a whole exchange at a time
+    while start - 2 >= summarized:
+        extra = _tokens(turns[start - 2:start])
+        if used + extra > budget:
+            break
+        used += extra
+        start -= 2
+
+    messages = head + turns[start:]
+    saved = max(_tokens(turns) - _tokens(messages), 0)
+    return messages, saved
+
+def record_turn(student_id, turns, messages, saved):
+    _emit("turn", {
+        "student_id": student_id,
+        "turns": len(turns),
+        "tokens_sent": _tokens(messages),
+        "tokens_saved": saved,
+    })
+
+def record_end(interview):
+    _emit("end", {
+        "student_id": interview.get("student_id"),
+        "turns": len(interview.get("turns", [])),
+        "tokens_saved": interview.get("tokens_saved", 0),
+    })
+
+def summary_due(interview, turns, keep=None):
+    keep = CONTEXT_TURNS if keep is None else keep
+    return _window_start(turns, keep) - (interview.get("summarized") or 0) >= SUMMARY_BATCH
+
+# Interviews with a summary being written by this process
+_summarizing = set()
+_summarizing_lock = threading.Lock()
+
+def refresh_summary_async(db, interview, turns):
+    """Fold turns that left the window into the summary, off the request thread."""
+    if not summary_due(interview, turns):
+        return
+    key = interview["_id"]
+    with _summarizing_lock:
+        if key in _summarizing:
+            # The running one covers these turns or the next answer starts another
+            return
+        _summarizing.add(key)
+
+    def run():
+        try:
+            refresh_summary(db, interview, turns)
+        finally:
+            with _summarizing_lock:
+                _summarizing.discard(key)
+
+    threading.Thread(target=run, daemon=True).start()
+
+def refresh_summary(db, interview, turns, keep=None):
+    from .models import ActiveInterview
+
+    keep = CONTEXT_TURNS if keep is None else keep
+    summarized = interview.get("summarized") or 0
+    upto = _window_start(turns, keep)
+    if upto <= summarized:
+        return False
+
+    old_summary = interview.get("summary") or ""
+    exchanges = "\n".join(f"{m['role']}: {m['parts'][0]}" for m in turns[summarized:upto])
+    # Summary space is taken out of the budget, so keep it to a fraction of it
+    words = max(CONTEXT_TOKEN_BUDGET // 6, 50)
+    prompt = SUMMARY_PROMPT.format(words=words, summary=old_summary or "(none yet)", exchanges=exchanges)
+    try:
+        summary = llm.generate([{"role": "user", "parts": [prompt]}], priority=ratelimit.LOW).strip()
+    except Exception as e:
+        log.error("conversation", "summary failed", error=str(e))
+        # Keep the most recent lines that fit rather than nothing
+        lines = (old_summary + "\n" + exchanges).strip().splitlines()
+        summary = ""
+        for line in reversed(lines):
+            if len(summary) + len(line) > words * 6:
+                break
+            summary = line[:500] + "\n" + summary
+        summary = summary.strip()
+
+    return ActiveInterview.set_summary(db, interview, summary, upto)
@@ -1,142 +1,623 @@
+import bisect
+import contextlib
+import copy
+import itertools
 import json
 import os
+import struct
+import threading
+import time
 import uuid
 from flask import g
 
+from . import metrics, snapshot
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 DB_FILE = 'database.json'
 
+# Storage engine for the local store: 'json' rewrites the whole file on every
+# change, 'wal' appends each change to a log next to it (see app/wal.py),
+# 'sharded' keeps one file per collection in DB_SHARD_DIR (see app/sharded.py).
+DB_ENGINE = os.getenv('DB_ENGINE', 'json')
+DB_SHARD_DIR = os.getenv('DB_SHARD_DIR', 'database.d')
+# On-disk format new snapshots are written in: 'json' or 'binary' (see
+# app/snapshot.py). Files in either format are read regardless.
+DB_FORMAT = os.getenv('DB_FORMAT', 'json')
+# Keep the parsed file in memory between reads (set DB_CACHE=0 to disable)
+DB_CACHE = os.getenv('DB_CACHE', '1') != '0'
+# Backend selection: MONGO_URI=sqlite:///path/to/file.db stores everything in
+# SQLite (see app/sqlite_db.py); otherwise the local JSON file is used.
+DB_URI = os.getenv('MONGO_URI', '')
+
+# Secondary indexes kept for each collection, as {field: unique}.
+# Lookups on these fields skip the linear scan.
+INDEXES = {
+    "users": {"_id": True, "email": True},
+    "reports": {"_id": True, "student_id": False, "role": False, "created_at": False},
+    "questions": {"role": False},
+    "active_interviews": {"student_id": True},
+    "jobs": {"_id": True, "status": False},
+    "resumes": {"_id": True},
+    "analytics": {"_id": True},
+}
+
+class DuplicateKeyError(Exception):
+    pass
+
+class DatabaseError(Exception):
+    pass
+
+class FileLock:
+    """Reader/writer lock shared by threads and processes, backed by ``path``.
+
+    Each acquisition locks its own descriptor, so threads exclude each other
+    the same way processes do. Re-entering from a thread that already holds
+    the lock is a no-op, which lets ``apply`` call ``read`` while writing.
+    Windows has no shared locks, so readers are exclusive there.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def acquire(self, exclusive=True):
+        if getattr(self._local, 'depth', 0):
+            self._local.depth += 1
+            try:
+                yield
+            finally:
+                self._local.depth -= 1
+            return
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            else:
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        time.sleep(0.01)
+            self._local.depth = 1
+            try:
+                yield
+            finally:
+                self._local.depth = 0
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                else:
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+class Index:
+    """Hash index from one field's value to the documents holding it.
+
+    The distinct keys can also be walked in sort order (see ``ordered``);
+    that list is built on first use and then kept up to date.
+    """
+
+    def __init__(self, field, unique=False):
+        self.field = field
+        self.unique = unique
+        # Document list the entries were built from; a new list means a re-read
+        self.source = None
+        self.entries = {}
+        # Sorted (_order(key), key) pairs, or None until a sorted query needs them
+        self._order = None
+        self._order_lock = threading.Lock()
+
+    def key(self, value):
+        # _id is matched by its string form (see _matches)
+        if self.field == '_id':
+            return str(value)
+        try:
+            hash(value)
+            return value
+        except TypeError:
+            return json.dumps(value, sort_keys=True)
+
+    def build(self, docs):
+        self.entries = {}
+        for doc in docs:
+            self.entries.setdefault(self.key(doc.get(self.field)), []).append(doc)
+        self.source = docs
+        with self._order_lock:
+            self._order = None
+
+    def lookup(self, value):
+        return self.entries.get(self.key(value), [])
+
+    def check(self, value, doc=None):
+        # Missing values never collide, like a sparse unique index
+        if not self.unique or value is None:
+            return
+        for other in self.lookup(value):
+            if other is not doc:
+                raise DuplicateKeyError(f"Duplicate key for {self.field}: {value!r}")
+
+    def add(self, doc):
+        key = self.key(doc.get(self.field))
+        bucket = self.entries.get(key)
+        if bucket is None:
+            self.entries[key] = [doc]
+            with self._order_lock:
+                if self._order is not None:
+                    bisect.insort(self._order, (_order(key), key))
+        else:
+            bucket.append(doc)
+
+    def remove(self, doc):
+        key = self.key(doc.get(self.field))
+        bucket = [other for other in self.entries.get(key, []) if other is not doc]
+        if bucket:
+            self.entries[key] = bucket
+        elif self.entries.pop(key, None) is not None:
+            with self._order_lock:
+                if self._order is not None:
+                    pair = (_order(key), key)
+                    i = bisect.bisect_left(self._order, pair)
+                    if i < len(self._order) and self._order[i] == pair:
+                        del self._order[i]
+
+    def replace(self, old, new):
+        """Swap ``new`` in for ``old``, keeping its place among documents with the same key."""
+        key = self.key(old.get(self.field))
+        if self.key(new.get(self.field)) != key:
+            self.remove(old)
+            self.add(new)
+            return
+        # A new bucket list, so readers holding the old one are unaffected
+        self.entries[key] = [new if doc is old else doc for doc in self.entries.get(key, [])]
+
+    def ordered(self, descending=False):
+        """Documents grouped by key, keys in sort order; each group keeps insertion order."""
+        with self._order_lock:
+            if self._order is None:
+                self._order = sorted((_order(key), key) for key in list(self.entries))
+            pairs = list(self._order)
+        for _, key in (reversed(pairs) if descending else pairs):
+            yield from list(self.entries.get(key, []))
+
+def _order(value):
+    """Sort key putting values of any type in one order: None, numbers, strings, booleans, the rest."""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (3, value)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    return (2, json.dumps(value, sort_keys=True))
+
+def _is_operator(value):
+    return isinstance(value, dict) and bool(value) and all(k.startswith('$') for k in value)
+
+def _select(docs, query, indexes):
+    # Narrow the scan to index buckets when the query pins an indexed field
+    for k, v in query.items():
+        if k not in indexes:
+            continue
+        if not _is_operator(v):
+            return indexes[k].lookup(v)
+        if set(v) == {'$in'}:
+            seen, selected = set(), []
+            for value in v['$in']:
+                for doc in indexes[k].lookup(value):
+                    if id(doc) not in seen:
+                        seen.add(id(doc))
+                        selected.append(doc)
+            return selected
+    return docs
+
+def _compare(value, op, arg):
+    if op == '$in':
+        return value in arg
+    if op == '$nin':
+        return value not in arg
+    if op == '$ne':
+        return value != arg
+    if op not in ('$gt', '$gte', '$lt', '$lte'):
+        raise ValueError(f"Unsupported query operator: {op}")
+    # Like Mongo, a missing field or a value of another type never compares
+    if value is None:
+        return False
+    try:
+        if op == '$gt':
+            return value > arg
+        if op == '$gte':
+            return value >= arg
+        if op == '$lt':
+            return value < arg
+        return value <= arg
+    except TypeError:
+        return False
+
+def _matches(item, query):
+    for k, v in query.items():
+        value = item.get(k)
+        # Handle ObjectId query simulation
+        if k == '_id':
+            value = str(value)
+            if _is_operator(v):
+                v = {op: [str(a) for a in arg] if op in ('$in', '$nin') else str(arg) for op, arg in v.items()}
+            else:
+                v = str(v)
+        if _is_operator(v):
+            if not all(_compare(value, op, arg) for op, arg in v.items()):
+                return False
+        elif value != v:
+            return False
+    return True
+
+def _sort_spec(sort):
+    """Normalize ``sort`` ("field", ("field", -1) or a list of those) to [(field, direction)]."""
+    if not sort:
+        return []
+    if isinstance(sort, str):
+        return [(sort, 1)]
+    if isinstance(sort, tuple):
+        return [sort]
+    return [(s, 1) if isinstance(s, str) else tuple(s) for s in sort]
+
+def _sorted(docs, sort):
+    docs = list(docs)
+    # Stable sorts from the last key to the first give a multi-key sort
+    for field, direction in reversed(sort):
+        docs.sort(key=lambda d: _order(d.get(field)), reverse=direction < 0)
+    return docs
+
+def _index_ordered(index, sort):
+    """Documents in ``sort`` order, walking ``index`` for the first key."""
+    descending = sort[0][1] < 0
+    if len(sort) == 1:
+        return index.ordered(descending)
+    groups = itertools.groupby(index.ordered(descending), key=lambda d: index.key(d.get(index.field)))
+    return itertools.chain.from_iterable(_sorted(group, sort[1:]) for _, group in groups)
+
+def _project(item, projection, clone=True):
+    """Copy of ``item`` with only the fields ``projection`` asks for ({field: 1} or {field: 0})."""
+    dup = copy.deepcopy if clone else (lambda v: v)
+    if not projection:
+        return dup(item)
+    included = {k for k, v in projection.items() if v and k != '_id'}
+    if included:
+        if projection.get('_id', 1):
+            included.add('_id')
+        return {k: dup(v) for k, v in item.items() if k in included}
+    excluded = {k for k, v in projection.items() if not v}
+    return {k: dup(v) for k, v in item.items() if k not in excluded}
+
+def apply_update(item, update):
+    # Basic implementation of $set, $inc and $push (with optional $each)
+    if "$set" in update:
+        for sk, sv in update["$set"].items():
+            item[sk] = sv
+    if "$inc" in update:
+        for ik, iv in update["$inc"].items():
+            item[ik] = (item.get(ik) or 0) + iv
+    if "$push" in update:
+        for pk, pv in update["$push"].items():
+            values = pv["$each"] if isinstance(pv, dict) and "$each" in pv else [pv]
+            if item.get(pk) is None:
+                item[pk] = []
+            item[pk].extend(values)
+
+def _swap(docs, old, new):
+    i = docs.index(old)
+    if docs[i] is not old:
+        # An equal document comes first; find this one by identity
+        i = next(n for n, doc in enumerate(docs) if doc is old)
+    docs[i] = new
+
+def apply_op(data, op, indexes=None):
+    """Apply one mutation record to ``data`` in place and return its result.
+
+    Records look like ``{"op": "insert" | "update" | "delete", "c": <collection>, ...}``
+    and are what the storage engines persist or replay, so applying the same
+    sequence of records to the same starting state always gives the same data.
+    ``indexes`` are the collection's indexes, kept in step with the change.
+    """
+    indexes = indexes or {}
+    kind = op['op']
+
+    if kind == 'insert':
+        docs = data.setdefault(op['c'], [])
+        doc = op['doc']
+        for index in indexes.values():
+            index.check(doc.get(index.field))
+        docs.append(doc)
+        for index in indexes.values():
+            index.add(doc)
+        return doc['_id']
+
+    docs = data.get(op['c'], [])
+
+    if kind == 'update':
+        for item in _select(docs, op['q'], indexes):
+            if _matches(item, op['q']):
+                # Readers copy documents without a lock, so never change one in
+                # place: update a copy (with its own copies of lists $push
+                # extends) and swap it in for the original
+                updated = dict(item)
+                for field in op['u'].get('$push', {}):
+                    if isinstance(item.get(field), list):
+                        updated[field] = list(item[field])
+                apply_update(updated, op['u'])
+                for field, index in indexes.items():
+                    if any(field in fields for fields in op['u'].values()):
+                        index.check(updated.get(index.field), item)
+                _swap(docs, item, updated)
+                for index in indexes.values():
+                    index.replace(item, updated)
+                return True
+        return False
+
+    if kind == 'delete':
+        victims = [item for item in _select(docs, op['q'], indexes) if _matches(item, op['q'])]
+        if victims:
+            doomed = set(map(id, victims))
+            kept = [item for item in docs if id(item) not in doomed]
+            # Swap in a new list so readers iterating the old one are unaffected
+            data[op['c']] = kept
+            for index in indexes.values():
+                for item in victims:
+                    index.remove(item)
+                index.source = kept
+        return len(victims)
+
+    raise ValueError(f"Unknown operation: {kind}")
+
+def changed(op, result):
+    return op['op'] == 'insert' or bool(result)
+
 class Collection:
     def __init__(self, db, name):
         self.db = db
         self.name = name
 
     def _get_data(self):
-        return self.db.read().get(self.name, [])
-
-    def find_one(self, query):
-        data = self._get_data()
-        for item in data:
-            match = True
-            for k, v in query.items():
-                # Handle ObjectId query simulation
-                if k == '_id':
-                    if str(item.get('_id')) != str(v):
-                        match = False
-                        break
-                elif item.get(k) != v:
-                    match = False
-                    break
-            if match:
-                return item
+        return self.db.documents(self.name)
+
+    def _candidates(self, query):
+        docs = self._get_data()
+        if not self.db.use_indexes:
+            return docs
+        return _select(docs, query, self.db.indexes(self.name, docs))
+
+    @metrics.db_operation("find_one")
+    def find_one(self, query, projection=None):
+        for item in self._candidates(query):
+            if _matches(item, query):
+                return _project(item, projection)
         return None
 
-    def find(self, query=None):
-        data = self._get_data()
-        if not query:
-            return data
-        
-        results = []
-        for item in data:
-            match = True
-            for k, v in query.items():
-                if item.get(k) != v:
-                    match = False
-                    break
-            if match:
-                results.append(item)
-        return results
+    @metrics.db_operation("find")
+    def find(self, query=None, projection=None, sort=None, skip=0, limit=None):
+        """Matching documents, optionally sorted, paged and projected (copies, like find_one).
+
+        ``sort`` is a field, a (field, 1 | -1) pair or a list of pairs. When an
+        index covers the first sort key and ``limit`` is set, the index is
+        walked in order and the scan stops once the page is full.
+        """
+        query = query or {}
+        sort = _sort_spec(sort)
+        # As in Mongo, a limit of 0 means no limit
+        limit = limit or None
+        docs = self._get_data()
+        indexes = self.db.indexes(self.name, docs) if self.db.use_indexes else {}
 
+        if sort and sort[0][0] in indexes and limit is not None:
+            matches = (item for item in _index_ordered(indexes[sort[0][0]], sort) if _matches(item, query))
+        else:
+            candidates = _select(docs, query, indexes) if query else docs
+            matches = [item for item in candidates if _matches(item, query)]
+            if sort:
+                matches = _sorted(matches, sort)
+            elif (skip or limit is not None) and candidates is not docs and len(matches) > 1:
+                # Index buckets are not in document order; pages must be the
+                # same with or without indexes (and in the SQLite engine)
+                wanted = set(map(id, matches))
+                matches = [item for item in docs if id(item) in wanted]
+
+        stop = None if limit is None else skip + limit
+        return [_project(item, projection) for item in itertools.islice(matches, skip, stop)]
+
+    @metrics.db_operation("insert_one")
     def insert_one(self, doc):
-        data = self.db.read()
-        if self.name not in data:
-            data[self.name] = []
-        
         if '_id' not in doc:
             doc['_id'] = str(uuid.uuid4())
-            
-        data[self.name].append(doc)
-        self.db.write(data)
-        
+
+        self.db.apply({"op": "insert", "c": self.name, "doc": copy.deepcopy(doc)})
+
         # Mimic PyMongo InsertResult
         class InsertResult:
             inserted_id = doc['_id']
         return InsertResult()
 
+    @metrics.db_operation("update_one")
     def update_one(self, query, update):
-        data = self.db.read()
-        collection_data = data.get(self.name, [])
-        
-        updated = False
-        for item in collection_data:
-            match = True
-            for k, v in query.items():
-                if item.get(k) != v:
-                    match = False
-                    break
-            
-            if match:
-                # Basic implementation of $set
-                if "$set" in update:
-                    for sk, sv in update["$set"].items():
-                        item[sk] = sv
-                updated = True
-                break
-        
-        if updated:
-            self.db.write(data)
-        return updated
+        return self.db.apply({"op": "update", "c": self.name, "q": query, "u": update})
 
+    @metrics.db_operation("delete_many")
     def delete_many(self, query):
-        data = self.db.read()
-        collection_data = data.get(self.name, [])
-        
-        new_collection_data = []
-        deleted_count = 0
-        
-        for item in collection_data:
-            match = True
-            for k, v in query.items():
-                if item.get(k) != v:
-                    match = False
-                    break
-            
-            if not match:
-                new_collection_data.append(item)
-            else:
-                deleted_count += 1
-        
-        if deleted_count > 0:
-            data[self.name] = new_collection_data
-            self.db.write(data)
-            
-        return deleted_count
+        return self.db.apply({"op": "delete", "c": self.name, "q": query})
+
+    def create_index(self, field, unique=False):
+        self.db.index_specs.setdefault(self.name, {})[field] = unique
+        return field
 
 class JsonDB:
-    def __init__(self, filepath=DB_FILE):
+    def __init__(self, filepath=DB_FILE, cache=DB_CACHE, initial=None, snapshot_format=DB_FORMAT):
+        if snapshot_format not in snapshot.FORMATS:
+            raise ValueError(f"Unknown DB_FORMAT: {snapshot_format}")
         self.filepath = filepath
-        if not os.path.exists(self.filepath):
-            with open(self.filepath, 'w') as f:
-                json.dump({"users": [], "job_roles": []}, f)
+        self.cache = cache
+        # Format new snapshots are written in; either one is read
+        self.snapshot_format = snapshot_format
+        self.lock = FileLock(filepath + '.lock')
+        # (file stamp, parsed data, collections decoded so far or None for all),
+        # swapped as one value so threads never see half of it
+        self._cached = None
+        # Index lookups only pay off while documents stay in memory between
+        # reads; writes always go through the indexes to enforce uniqueness
+        self.use_indexes = cache
+        self.index_specs = {name: dict(fields) for name, fields in INDEXES.items()}
+        self._indexes = {}
+        with self.lock.acquire():
+            if not os.path.exists(self.filepath):
+                with open(self.filepath, 'wb') as f:
+                    f.write(self._encode(initial if initial is not None else {"users": [], "job_roles": []}))
 
-    def read(self):
+    def _stamp(self):
+        # Changes whenever the file is rewritten, by this process or another one
+        st = os.stat(self.filepath)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _encode(self, data):
+        if self.snapshot_format == 'binary':
+            return snapshot.encode(data)
+        return json.dumps(data, indent=2).encode('utf-8')
+
+    def _parse(self, names=None, data=None):
+        """Decode the file, or only collections ``names`` (into ``data``) if it is binary.
+
+        Returns the data and whether every collection is now in it.
+        """
+        try:
+            if not snapshot.is_binary(self.filepath):
+                with open(self.filepath, 'r') as f:
+                    metrics.record_bytes("read", os.fstat(f.fileno()).st_size)
+                    return json.load(f), True
+            with snapshot.Reader(self.filepath) as reader:
+                data = {} if data is None else data
+                for name in reader.names() if names is None else names:
+                    if name in reader.table and name not in data:
+                        metrics.record_bytes("read", reader.table[name][1])
+                        data[name] = reader.collection(name)
+                return data, names is None
+        except FileNotFoundError:
+            return {}, True
+        except (ValueError, EOFError, TypeError, struct.error) as e:
+            # Never fall back to an empty database: the next write would wipe it
+            raise DatabaseError(f"{self.filepath} is corrupt: {e}") from e
+
+    def _load(self, name=None):
+        """The cache entry for the file on disk, with ``name`` (or everything) decoded."""
         try:
-            with open(self.filepath, 'r') as f:
-                return json.load(f)
-        except:
-            return {}
+            stamp = self._stamp()
+        except OSError:
+            return (None, {}, None)
+        cached = self._cached
+        if cached is not None and cached[0] == stamp and (cached[2] is None or name in cached[2]):
+            return cached
+
+        with self.lock.acquire(exclusive=False):
+            stamp = self._stamp()
+            cached = self._cached
+            if cached is None or cached[0] != stamp:
+                cached = (stamp, {}, set())
+            stamp, data, loaded = cached
+            if loaded is not None and (name is None or name not in loaded):
+                # Decoded collections are kept, so lists (and their indexes) stay the same objects
+                data, complete = self._parse(None if name is None else [name], data)
+                loaded = None if complete else loaded | {name}
+            cached = self._cached = (stamp, data, loaded)
+        return cached
+
+    def read(self):
+        """Return the parsed database.
+
+        With caching on, the same dict is returned until the file changes on
+        disk, so callers must not mutate it outside of ``apply``.
+        """
+        if not self.cache:
+            with self.lock.acquire(exclusive=False):
+                return self._parse()[0]
+        return self._load()[1]
 
     def write(self, data):
-        with open(self.filepath, 'w') as f:
-            json.dump(data, f, indent=2)
+        with self.lock.acquire():
+            self._cached = None
+            # Write a sibling file and swap it in, so readers never see half a file
+            tmp_path = self.filepath + '.tmp'
+            blob = self._encode(data)
+            metrics.record_bytes("written", len(blob))
+            with open(tmp_path, 'wb') as f:
+                f.write(blob)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.filepath)
+            if self.cache:
+                self._cached = (self._stamp(), data, None)
+
+    def documents(self, name):
+        if not self.cache:
+            return self.read().get(name, [])
+        # A binary snapshot only decodes the collection asked for
+        return self._load(name)[1].get(name, [])
+
+    def indexes(self, name, docs):
+        """Return the indexes of collection ``name``, rebuilt if ``docs`` is a fresh read."""
+        indexes = self._indexes.setdefault(name, {})
+        for field, unique in self.index_specs.get(name, {}).items():
+            index = indexes.get(field)
+            if index is None or index.unique != unique:
+                index = indexes[field] = Index(field, unique)
+            if index.source is not docs:
+                index.build(docs)
+        return indexes
+
+    def apply(self, op):
+        # Re-read and rewrite under one exclusive lock, so concurrent writers
+        # in other threads or workers cannot lose each other's updates
+        with self.lock.acquire():
+            data = self.read()
+            try:
+                result = apply_op(data, op, self.indexes(op['c'], data.setdefault(op['c'], [])))
+                if changed(op, result):
+                    self.write(data)
+            except Exception:
+                # The cached copy may hold a change that never reached the disk
+                self._cached = None
+                raise
+        return result
 
     def getattr(self, name):
         return Collection(self, name)
-    
+
     # Allow attribute access like db.users
     def __getattr__(self, name):
         return Collection(self, name)
 
-db_instance = JsonDB()
+def open_db(uri=DB_URI, engine=DB_ENGINE):
+    if uri.startswith('sqlite:///'):
+        from .sqlite_db import SQLiteDB
+        return SQLiteDB(uri[len('sqlite:///'):])
+    if engine == 'wal':
+        from .wal import LogDB
+        return LogDB()
+    if engine == 'sharded':
+        from .sharded import ShardedDB
+        return ShardedDB()
+    return JsonDB()
+
+db_instance = None
+_db_lock = threading.Lock()
 
 def get_db():
+    global db_instance
+    if db_instance is None:
+        with _db_lock:
+            if db_instance is None:
+                db_instance = open_db()
     return db_instance
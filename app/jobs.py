@@ -0,0 +1,126 @@
+"""Background job workers backed by the ``jobs`` collection.
+
+``enqueue(kind, payload)`` stores a job and returns its id straight away;
+worker threads claim queued jobs, run the handler registered for their kind
+and store its result. A failed job goes back to the queue after a backoff
+(or the delay a quota error asked for) until it runs out of attempts.
+
+Because jobs live in the database, every process running the app can work
+the same queue: claims are conditional updates, so each job runs once, and
+a job whose worker died is picked up again when its lease runs out.
+
+JOB_WORKERS sets the threads per process (0 to only enqueue). They start on
+the process's first request or enqueue, not on import, so scripts importing
+the app run none, and each worker forked by a preloading server (e.g.
+``gunicorn --preload``) starts its own.
+"""
+import os
+import threading
+import time
+
+from . import log, ratelimit
+from .db import get_db
+from .models import Job
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+MAX_ATTEMPTS = 5
+# Seconds before the first retry; doubled on each later one
+BACKOFF_BASE = 2.0
+MAX_BACKOFF = 300.0
+# A running job not finished within this long is assumed orphaned
+LEASE_SECONDS = 600.0
+# How often idle workers look for jobs enqueued by other processes
+POLL_INTERVAL = 1.0
+
+class JobQueue:
+    def __init__(self, workers=JOB_WORKERS):
+        self.workers = workers
+        self.handlers = {}
+        self._wake = threading.Condition()
+        self._threads = []
+        # Process the threads were started in; threads do not survive a fork
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def register(self, kind, handler=None):
+        """Register ``handler(payload, job_id)`` for ``kind``; usable as a decorator."""
+        if handler is None:
+            return lambda fn: self.register(kind, fn)
+        self.handlers[kind] = handler
+        return handler
+
+    def enqueue(self, kind, payload, owner=None):
+        self.start()
+        job_id = Job.create(get_db(), kind, payload, owner).inserted_id
+        with self._wake:
+            self._wake.notify()
+        return job_id
+
+    def start(self):
+        """Start this process's worker threads, unless they are already running."""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # A forked child inherits the list but not the threads in it
+            self._wake = threading.Condition()
+            self._threads = []
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            try:
+                job = self._claim()
+            except Exception as e:
+                log.error("jobs", "claim failed", error=str(e))
+                job = None
+            if job is None:
+                with self._wake:
+                    self._wake.wait(POLL_INTERVAL)
+                continue
+            self._execute(job)
+
+    def _claim(self):
+        db = get_db()
+        now = time.time()
+        # Payloads carry whole transcripts; only load the one we win
+        fields = {"payload": 0, "result": 0}
+        ready = db.jobs.find({"status": "queued", "run_at": {"$lte": now}}, projection=fields, sort="run_at")
+        ready += db.jobs.find({"status": "running", "lease_until": {"$lt": now}}, projection=fields)
+        for job in ready:
+            if job["kind"] in self.handlers and Job.claim(db, job, LEASE_SECONDS):
+                return Job.get_by_id(db, job["_id"])
+        return None
+
+    def _execute(self, job):
+        db = get_db()
+        try:
+            result = self.handlers[job["kind"]](job["payload"], job["_id"])
+        except Exception as e:
+            error = str(e)
+            if job["attempts"] >= MAX_ATTEMPTS:
+                log.error("jobs", "job failed", exc=True, job=job["_id"], kind=job["kind"], attempts=job["attempts"])
+                Job.fail(db, job["_id"], error)
+                return
+            delay = min(BACKOFF_BASE * 2 ** (job["attempts"] - 1), MAX_BACKOFF)
+            if ratelimit.is_quota_error(e):
+                delay = max(delay, ratelimit.retry_after(e) or 0)
+            log.warning("jobs", "job attempt failed, retrying", job=job["_id"], kind=job["kind"],
+                        attempts=job["attempts"], retry_in=round(delay), error=error)
+            Job.retry(db, job["_id"], error, delay)
+            return
+        Job.finish(db, job["_id"], result)
+
+queue = JobQueue()
+register = queue.register
+enqueue = queue.enqueue
+start = queue.start
+
+def init_app(app):
+    """Start the workers with the first request each process serves."""
+    app.before_request(start)
@@ -0,0 +1,387 @@
+"""Provider-agnostic access to the language models behind the interview.
+
+``generate(messages, json_mode)`` returns the reply text and ``stream(messages)``
+yields it chunk by chunk. Messages use the shape the interview routes
+already store, ``[{"role": "user" | "model", "parts": [text]}]``, and each
+provider translates them for its SDK.
+
+Model objects and SDK clients are created once per (provider, model, config)
+and reused, so requests share the SDK's underlying connections.
+
+Providers:
+- ``gemini``: Google Gemini (needs GOOGLE_API_KEY)
+- ``openai``: OpenAI chat completions (needs OPENAI_API_KEY)
+- ``fake``: offline canned replies, for development and load tests. Set
+  FAKE_LLM_LATENCY (seconds) to simulate a slow model and FAKE_LLM_429_RATE
+  (0-1) to inject quota errors.
+
+LLM_PROVIDER picks the default; without it Gemini is used when
+GOOGLE_API_KEY is set and the fake provider otherwise.
+
+Every call first waits its turn in ``app.ratelimit``, and quota errors are
+retried there, after the delay the server asked for.
+
+A ``Context`` is a prompt prefix reused by every call of one interview
+(system prompt plus resume). Providers that can cache it server-side
+(Gemini context caching) get it uploaded once per key and referenced on
+later calls; otherwise it is prepended to the messages unchanged, which
+keeps the prefix byte-identical for providers that cache prefixes on their
+own. Contexts expire after LLM_CONTEXT_TTL seconds or on ``evict_context``;
+a call that finds the provider's copy gone uploads it again.
+A context's ``text`` may be a function, called only when the text has to be
+sent or uploaded.
+"""
+import collections
+import datetime
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+from . import log, metrics, ratelimit
+from .ratelimit import RateLimitError
+
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "dummy-key")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "dummy-key")
+LLM_PROVIDER = os.getenv("LLM_PROVIDER") or ("gemini" if GOOGLE_API_KEY != "dummy-key" else "fake")
+
+DEFAULT_MODELS = {
+    "gemini": "gemini-2.5-flash",
+    "openai": "gpt-4o",
+    "fake": "fake",
+}
+
+# Seconds a cached prompt prefix is kept
+CONTEXT_TTL = int(os.getenv("LLM_CONTEXT_TTL", "3600"))
+
+Context = collections.namedtuple("Context", "key text")
+
+FAKE_TURN = {
+    "feedback": "This is a mock response (No API Key).",
+    "question": "What is your greatest strength? (Mock)"
+}
+
+FAKE_REPORT = {
+    "score": 85,
+    "summary": "Good technical understanding but needs more confidence.",
+    "strengths": ["Python Knowledge", "Problem Solving"],
+    "weaknesses": ["Communication Speed", "System Design Depth"],
+    "suggestion": "Practice mock interviews to improve pacing."
+}
+
+class GeminiProvider:
+    name = "gemini"
+
+    def __init__(self):
+        import google.generativeai as genai
+        self.genai = genai
+        if GOOGLE_API_KEY != "dummy-key":
+            genai.configure(api_key=GOOGLE_API_KEY)
+
+    def _model(self, model, json_mode, system, cached=None):
+        config = {"response_mime_type": "application/json"} if json_mode else None
+        if cached is not None:
+            return _cached(
+                (self.name, cached.name, json_mode),
+                lambda: self.genai.GenerativeModel.from_cached_content(cached, generation_config=config)
+            )
+        return _cached(
+            (self.name, model, json_mode, system),
+            lambda: self.genai.GenerativeModel(model, generation_config=config, system_instruction=system)
+        )
+
+    def create_context(self, model, text, ttl):
+        from google.generativeai import caching
+        return caching.CachedContent.create(
+            model=model,
+            contents=[{"role": "user", "parts": [text]}],
+            ttl=datetime.timedelta(seconds=ttl)
+        )
+
+    def forget_context(self, cached):
+        with _cache_lock:
+            for key in [k for k in _cache if k[:2] == (self.name, cached.name)]:
+                del _cache[key]
+
+    def drop_context(self, cached):
+        self.forget_context(cached)
+        cached.delete()
+
+    def generate(self, messages, model, json_mode=False, system=None, cached=None):
+        response = self._model(model, json_mode, system, cached).generate_content(messages)
+        return response.text
+
+    def stream(self, messages, model, system=None, cached=None):
+        for chunk in self._model(model, False, system, cached).generate_content(messages, stream=True):
+            yield chunk.text
+
+class OpenAIProvider:
+    name = "openai"
+
+    def __init__(self):
+        import openai
+        self.openai = openai
+        # openai>=1.0 has a client object holding a pooled HTTP connection
+        self.client = openai.OpenAI(api_key=OPENAI_API_KEY) if hasattr(openai, "OpenAI") else None
+        if self.client is None:
+            openai.api_key = OPENAI_API_KEY
+
+    def _messages(self, messages, system):
+        converted = [{"role": "system", "content": system}] if system else []
+        for m in messages:
+            role = "assistant" if m["role"] == "model" else m["role"]
+            converted.append({"role": role, "content": "\n".join(m["parts"])})
+        return converted
+
+    def generate(self, messages, model, json_mode=False, system=None):
+        kwargs = {"model": model, "messages": self._messages(messages, system), "temperature": 0.0}
+        if json_mode:
+            kwargs["response_format"] = {"type": "json_object"}
+        if self.client is None:
+            resp = self.openai.ChatCompletion.create(**kwargs)
+            return resp.choices[0].message["content"]
+        return self.client.chat.completions.create(**kwargs).choices[0].message.content
+
+    def stream(self, messages, model, system=None):
+        if self.client is None:
+            yield self.generate(messages, model, system=system)
+            return
+        chunks = self.client.chat.completions.create(
+            model=model, messages=self._messages(messages, system), stream=True
+        )
+        for chunk in chunks:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+class FakeProvider:
+    name = "fake"
+
+    def __init__(self, latency=None, error_rate=None, seed=None):
+        self.latency = float(os.getenv("FAKE_LLM_LATENCY", "0")) if latency is None else latency
+        self.error_rate = float(os.getenv("FAKE_LLM_429_RATE", "0")) if error_rate is None else error_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    def _call(self):
+        self.calls += 1
+        if self.error_rate and self.random.random() < self.error_rate:
+            raise RateLimitError("429 Resource has been exhausted (fake). Please retry in 1s.", retry_after=1.0)
+
+    def generate(self, messages, model, json_mode=False, system=None):
+        self._call()
+        if self.latency:
+            time.sleep(self.latency)
+        return json.dumps(FAKE_REPORT if json_mode else FAKE_TURN)
+
+    def stream(self, messages, model, system=None):
+        self._call()
+        text = json.dumps(FAKE_TURN)
+        step = 16
+        for i in range(0, len(text), step):
+            if self.latency:
+                time.sleep(self.latency * step / len(text))
+            yield text[i:i + step]
+
+PROVIDERS = {
+    "gemini": GeminiProvider,
+    "openai": OpenAIProvider,
+    "fake": FakeProvider,
+}
+
+_cache = {}
+_cache_lock = threading.Lock()
+# Model objects kept besides the providers; each cached context adds its own
+MODEL_CACHE_SIZE = 256
+
+def _cached(key, factory):
+    obj = _cache.get(key)
+    if obj is None:
+        with _cache_lock:
+            obj = _cache.get(key)
+            if obj is None:
+                obj = _cache[key] = factory()
+                if len(_cache) > MODEL_CACHE_SIZE:
+                    # Oldest first; providers hold configuration, so they stay
+                    del _cache[next(k for k in _cache if k[0] != "provider")]
+    return obj
+
+def get_provider(name=None):
+    name = name or LLM_PROVIDER
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown LLM provider: {name}")
+    return _cached(("provider", name), PROVIDERS[name])
+
+def set_provider(provider):
+    """Install a provider instance (e.g. a configured FakeProvider) under its name."""
+    with _cache_lock:
+        _cache[("provider", provider.name)] = provider
+
+def context_text(context):
+    return context.text() if callable(context.text) else context.text
+
+def context_key(*parts):
+    """Stable key for a prompt prefix built from ``parts``."""
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+# key -> {"expires": t, "remote": {(provider, model): cached content or None}}
+_contexts = {}
+_contexts_lock = threading.Lock()
+
+def _remote_context(p, model, context):
+    """The provider-side cache for ``context``, creating it if needed; None if unavailable."""
+    if not hasattr(p, "create_context"):
+        return None
+    slot = (p.name, model)
+    now = time.time()
+    with _contexts_lock:
+        _expire_contexts(now)
+        entry = _contexts.setdefault(context.key, {"expires": now + CONTEXT_TTL, "remote": {}})
+        if slot in entry["remote"]:
+            return entry["remote"][slot]
+
+    try:
+        # Outlive our own expiry so a handle we still hold is never stale
+        cached = p.create_context(model, context_text(context), CONTEXT_TTL + 60)
+    except Exception as e:
+        # e.g. prompt below the provider's minimum cacheable size; remember and send it inline
+        log.warning("llm", "context cache unavailable", model=model, error=str(e))
+        cached = None
+
+    with _contexts_lock:
+        remote = entry["remote"]
+        if slot in remote and cached is not None:
+            # Another thread created one first; keep theirs
+            _drop(p, cached)
+        return remote.setdefault(slot, cached)
+
+def _expire_contexts(now):
+    # The provider expires its copies on its own schedule, so just forget ours
+    # (and the model objects built on them)
+    for key in [k for k, entry in _contexts.items() if entry["expires"] < now]:
+        for (name, _), cached in _contexts.pop(key)["remote"].items():
+            p = get_provider(name)
+            if cached is not None and hasattr(p, "forget_context"):
+                p.forget_context(cached)
+
+def _drop(p, cached):
+    try:
+        p.drop_context(cached)
+    except Exception as e:
+        log.warning("llm", "context cache delete failed", error=str(e))
+
+def evict_context(key):
+    """Forget a prompt prefix and delete any provider-side copies of it."""
+    with _contexts_lock:
+        entry = _contexts.pop(key, None)
+    for (name, _), cached in (entry or {}).get("remote", {}).items():
+        if cached is not None:
+            _drop(get_provider(name), cached)
+
+def _is_missing_context(error):
+    # google.api_core's NotFound carries the HTTP status as ``code``
+    return getattr(error, "code", None) == 404 or type(error).__name__ == "NotFound"
+
+def _forget_context(p, model, context, cached):
+    """Stop using a provider-side cache that is gone (deleted or expired there)."""
+    with _contexts_lock:
+        remote = _contexts.get(context.key, {}).get("remote", {})
+        if remote.get((p.name, model)) is cached:
+            del remote[(p.name, model)]
+    if hasattr(p, "forget_context"):
+        p.forget_context(cached)
+
+def _with_context(p, model, context, messages):
+    """Return the provider-side cache to use (if any) and the messages to send."""
+    if context is None:
+        return None, messages
+    # A cached prefix needs at least one new message after it
+    cached = _remote_context(p, model, context) if messages else None
+    if cached is not None:
+        return cached, messages
+    return None, [{"role": "user", "parts": [context_text(context)]}] + list(messages)
+
+# Quota errors retried (after the server's hint) before the caller sees them
+QUOTA_RETRIES = 3
+# Pause used when a 429 carries no retry hint
+DEFAULT_RETRY_AFTER = 5.0
+
+def _throttle(model, messages, system, priority):
+    limiter = ratelimit.get_limiter(model)
+    if limiter is not None:
+        started = time.perf_counter()
+        limiter.acquire(ratelimit.estimate_tokens(messages, system), priority)
+        metrics.record_throttle(model, time.perf_counter() - started)
+    return limiter
+
+def _back_off(limiter, model, error):
+    delay = ratelimit.retry_after(error) or DEFAULT_RETRY_AFTER
+    metrics.record_retry(model, delay)
+    if limiter is not None:
+        limiter.block(delay)
+    else:
+        time.sleep(delay)
+
+def _outcome(error):
+    if error is None:
+        return "ok"
+    return "rate_limited" if ratelimit.is_quota_error(error) else "error"
+
+def generate(messages, json_mode=False, provider=None, model=None, system=None,
+             priority=ratelimit.NORMAL, context=None):
+    p = get_provider(provider)
+    model = model or DEFAULT_MODELS[p.name]
+    turns = messages
+    cached, messages = _with_context(p, model, context, turns)
+    extra = {"cached": cached} if cached is not None else {}
+    tokens = ratelimit.estimate_tokens(messages, system)
+    for attempt in range(QUOTA_RETRIES + 1):
+        limiter = _throttle(model, messages, system, priority)
+        started = time.perf_counter()
+        try:
+            text = p.generate(messages, model, json_mode=json_mode, system=system, **extra)
+        except Exception as e:
+            metrics.record_llm(p.name, model, time.perf_counter() - started, _outcome(e), tokens)
+            if cached is not None and attempt < QUOTA_RETRIES and _is_missing_context(e):
+                # Our handle outlived the provider's copy; upload a new one and go again
+                _forget_context(p, model, context, cached)
+                cached, messages = _with_context(p, model, context, turns)
+                extra = {"cached": cached} if cached is not None else {}
+                continue
+            if attempt == QUOTA_RETRIES or not ratelimit.is_quota_error(e):
+                raise
+            _back_off(limiter, model, e)
+        else:
+            metrics.record_llm(p.name, model, time.perf_counter() - started, "ok", tokens, len(text or "") // 4)
+            return text
+
+def stream(messages, provider=None, model=None, system=None, priority=ratelimit.NORMAL, context=None):
+    p = get_provider(provider)
+    model = model or DEFAULT_MODELS[p.name]
+    turns = messages
+    cached, messages = _with_context(p, model, context, turns)
+    extra = {"cached": cached} if cached is not None else {}
+    tokens = ratelimit.estimate_tokens(messages, system)
+    for attempt in range(QUOTA_RETRIES + 1):
+        limiter = _throttle(model, messages, system, priority)
+        started = False
+        began, chars = time.perf_counter(), 0
+        try:
+            for chunk in p.stream(messages, model, system=system, **extra):
+                started = True
+                chars += len(chunk or "")
+                yield chunk
+            metrics.record_llm(p.name, model, time.perf_counter() - began, "ok", tokens, chars // 4)
+            return
+        except Exception as e:
+            metrics.record_llm(p.name, model, time.perf_counter() - began, _outcome(e), tokens, chars // 4)
+            if not started and cached is not None and attempt < QUOTA_RETRIES and _is_missing_context(e):
+                _forget_context(p, model, context, cached)
+                cached, messages = _with_context(p, model, context, turns)
+                extra = {"cached": cached} if cached is not None else {}
+                continue
+            # Once text has gone out a retry would repeat it
+            if started or attempt == QUOTA_RETRIES or not ratelimit.is_quota_error(e):
+                raise
+            _back_off(limiter, model, e)
@@ -0,0 +1,188 @@
+"""Structured application logging.
+
+Each record is one JSON line, ``{"ts", "level", "category", "event", ...}``
+plus whatever fields the caller passed. Log turn ids and sizes, not payloads.
+Records go through a bounded queue to a background thread that does the
+formatting and I/O, so logging never blocks a request; if the queue is full
+the record is dropped and counted instead.
+
+Categories can be sampled, e.g. ``LOG_SAMPLE="turn=0.1"`` keeps one chat
+turn record in ten (warnings and errors are never sampled out), and each is
+rate limited to LOG_RATE_LIMIT records per second. The next record let
+through in a category carries ``suppressed``: how many were skipped since.
+
+LOG_TRANSCRIPTS=1 also writes full prompts, transcripts and raw model
+replies to the rotating LOG_TRANSCRIPT_FILE. That is for debugging only:
+those records contain resumes and candidates' answers.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+from . import metrics
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Empty for stderr
+LOG_FILE = os.getenv("LOG_FILE", "")
+LOG_RATE_LIMIT = float(os.getenv("LOG_RATE_LIMIT", "50"))
+LOG_QUEUE_SIZE = 10000
+LOG_TRANSCRIPTS = os.getenv("LOG_TRANSCRIPTS", "0") == "1"
+LOG_TRANSCRIPT_FILE = os.getenv("LOG_TRANSCRIPT_FILE", os.path.join("logs", "transcripts.log"))
+TRANSCRIPT_MAX_BYTES = 10 * 1024 * 1024
+TRANSCRIPT_BACKUPS = 5
+
+def parse_sample(spec):
+    rates = {}
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        category, _, rate = item.partition("=")
+        rates[category.strip()] = float(rate)
+    return rates
+
+LOG_SAMPLE = parse_sample(os.getenv("LOG_SAMPLE", ""))
+
+suppressed_records = metrics.Counter("log_records_suppressed_total", "Log records not written.", ("category", "reason"))
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "category": getattr(record, "category", record.name),
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class SamplingFilter(logging.Filter):
+    """Per-category sampling and token-bucket rate limit, applied on the caller's thread."""
+
+    def __init__(self, sample=None, rate=LOG_RATE_LIMIT):
+        super().__init__()
+        self.sample = sample or {}
+        self.rate = rate
+        self._buckets = {}
+        self._suppressed = {}
+        self._lock = threading.Lock()
+
+    def _skip(self, category, reason):
+        self._suppressed[category] = self._suppressed.get(category, 0) + 1
+        suppressed_records.inc(1, category, reason)
+        return False
+
+    def filter(self, record):
+        category = getattr(record, "category", record.name)
+        with self._lock:
+            keep = self.sample.get(category, 1.0)
+            if record.levelno < logging.WARNING and keep < 1.0 and random.random() >= keep:
+                return self._skip(category, "sampled")
+            if self.rate:
+                now = time.monotonic()
+                tokens, last = self._buckets.get(category, (self.rate, now))
+                tokens = min(self.rate, tokens + (now - last) * self.rate)
+                if tokens < 1:
+                    self._buckets[category] = (tokens, now)
+                    return self._skip(category, "rate_limited")
+                self._buckets[category] = (tokens - 1, now)
+            skipped = self._suppressed.pop(category, 0)
+        if skipped:
+            record.fields = dict(getattr(record, "fields", {}), suppressed=skipped)
+        return True
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records rather than wait for room, and leaves formatting to the listener."""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            suppressed_records.inc(1, getattr(record, "category", record.name), "queue_full")
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+_listeners = []
+_setup_lock = threading.Lock()
+_loggers = {}
+
+def _queued_logger(name, handler, level, log_filter=None):
+    records = queue.Queue(LOG_QUEUE_SIZE)
+    handler.setFormatter(JsonFormatter())
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+    _listeners.append(listener)
+
+    queue_handler = DroppingQueueHandler(records)
+    if log_filter is not None:
+        queue_handler.addFilter(log_filter)
+    logger = logging.getLogger(name)
+    logger.handlers = [queue_handler]
+    logger.setLevel(level)
+    # Keep these records out of whatever the host app configured on the root logger
+    logger.propagate = False
+    return logger
+
+def _logger(kind="app"):
+    logger = _loggers.get(kind)
+    if logger is None:
+        with _setup_lock:
+            logger = _loggers.get(kind)
+            if logger is None:
+                if kind == "app":
+                    handler = logging.FileHandler(LOG_FILE) if LOG_FILE else logging.StreamHandler(sys.stderr)
+                    logger = _queued_logger("interview", handler, LOG_LEVEL, SamplingFilter(LOG_SAMPLE))
+                else:
+                    os.makedirs(os.path.dirname(LOG_TRANSCRIPT_FILE) or ".", exist_ok=True)
+                    handler = logging.handlers.RotatingFileHandler(
+                        LOG_TRANSCRIPT_FILE, maxBytes=TRANSCRIPT_MAX_BYTES, backupCount=TRANSCRIPT_BACKUPS)
+                    logger = _queued_logger("interview.transcripts", handler, logging.DEBUG)
+                _loggers[kind] = logger
+    return logger
+
+def _after_fork():
+    # The listener threads stayed in the parent; the next record starts this process's own
+    global _setup_lock
+    _loggers.clear()
+    _listeners.clear()
+    _setup_lock = threading.Lock()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+def event(category, message, level=logging.INFO, exc=False, **fields):
+    logger = _logger()
+    if logger.isEnabledFor(level):
+        logger.log(level, message, exc_info=exc, extra={"category": category, "fields": fields})
+
+def warning(category, message, **fields):
+    event(category, message, logging.WARNING, **fields)
+
+def error(category, message, exc=False, **fields):
+    """Log an error; ``exc=True`` (inside an ``except`` block) adds the traceback."""
+    event(category, message, logging.ERROR, exc=exc, **fields)
+
+def transcript(category, message, **fields):
+    """Full payloads for debugging; dropped unless LOG_TRANSCRIPTS=1."""
+    if LOG_TRANSCRIPTS:
+        _logger("transcripts").debug(message, extra={"category": category, "fields": fields})
+
+@atexit.register
+def flush():
+    """Write out everything still queued."""
+    while _listeners:
+        _listeners.pop().stop()
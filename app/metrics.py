@@ -0,0 +1,216 @@
+"""Process metrics in the Prometheus text format, served on ``/metrics``.
+
+METRICS selects how much is recorded:
+
+- ``off``: nothing; ``/metrics`` is not registered.
+- ``basic`` (default): request counts and latency per endpoint, database
+  operation counts and bytes read/written, LLM call latency, retries, 429s,
+  throttling waits and estimated tokens. Each is a counter increment or
+  histogram bucket update, cheap enough to leave on.
+- ``full``: also a latency histogram per database operation, and for every
+  request how much of its time went to the database and to the LLM.
+
+Metrics are per process; with several workers scrape each one.
+"""
+import functools
+import os
+import threading
+import time
+
+METRICS = os.getenv("METRICS", "basic")
+enabled = METRICS != "off"
+detailed = METRICS == "full"
+
+# Seconds
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_registry = []
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, *values):
+        with _lock:
+            self.values[values] = self.values.get(values, 0) + amount
+
+    def render(self):
+        for values, total in sorted(self.values.items()):
+            yield f"{self.name}{_labels(self.labels, values)} {total}"
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket..., sum, count]
+        self.values = {}
+        _registry.append(self)
+
+    def observe(self, value, *values):
+        with _lock:
+            series = self.values.get(values)
+            if series is None:
+                series = self.values[values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        for values, series in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(self.labels, values, [('le', bound)])} {cumulative}"
+            yield f"{self.name}_bucket{_labels(self.labels, values, [('le', '+Inf')])} {series[-1]}"
+            yield f"{self.name}_sum{_labels(self.labels, values)} {series[-2]:.6f}"
+            yield f"{self.name}_count{_labels(self.labels, values)} {series[-1]}"
+
+def render():
+    lines = []
+    with _lock:
+        for metric in _registry:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+http_requests = Counter("http_requests_total", "HTTP requests handled.", ("endpoint", "method", "status"))
+http_latency = Histogram("http_request_duration_seconds", "Time to produce a response (first byte for streams).", ("endpoint",))
+request_db_time = Histogram("http_request_db_seconds", "Database time spent per request (METRICS=full).", ("endpoint",))
+request_llm_time = Histogram("http_request_llm_seconds", "LLM time, including throttling and retries, per request (METRICS=full).", ("endpoint",))
+
+db_operations = Counter("db_operations_total", "Database operations.", ("collection", "op"))
+db_latency = Histogram("db_operation_duration_seconds", "Database operation latency (METRICS=full).", ("collection", "op"))
+db_bytes = Counter("db_bytes_total", "Bytes read from and written to the database files.", ("direction",))
+
+llm_calls = Counter("llm_calls_total", "LLM calls by outcome (ok, rate_limited, error).", ("provider", "model", "outcome"))
+llm_latency = Histogram("llm_call_duration_seconds", "LLM call latency (whole stream for streaming calls).", ("provider", "model"))
+llm_retries = Counter("llm_retries_total", "LLM calls retried after a 429.", ("model",))
+llm_retry_sleep = Counter("llm_retry_sleep_seconds_total", "Time spent backing off after 429s.", ("model",))
+llm_throttle_wait = Histogram("llm_throttle_wait_seconds", "Time calls waited for the rate limiter.", ("model",))
+llm_tokens = Counter("llm_estimated_tokens_total", "Estimated tokens sent and received.", ("model", "direction"))
+tokens_saved = Counter("conversation_tokens_saved_total", "Input tokens not sent thanks to the bounded context.")
+section_latency = Histogram("app_section_duration_seconds", "Latency of instrumented code sections.", ("section",))
+
+# Per-thread time attributed to the request being handled on it
+_local = threading.local()
+
+def _charge(kind, seconds):
+    if detailed and getattr(_local, "active", False):
+        setattr(_local, kind, getattr(_local, kind) + seconds)
+
+def record_db(collection, op, seconds):
+    db_operations.inc(1, collection, op)
+    if detailed:
+        db_latency.observe(seconds, collection, op)
+        _charge("db", seconds)
+
+def record_bytes(direction, count):
+    if enabled:
+        db_bytes.inc(count, direction)
+
+def db_operation(op):
+    """Decorate a collection method (on an object with ``.name``) to count and time it."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            if not enabled:
+                return fn(self, *args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return fn(self, *args, **kwargs)
+            finally:
+                record_db(self.name, op, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+def record_llm(provider, model, seconds, outcome, tokens_in=0, tokens_out=0):
+    if not enabled:
+        return
+    llm_calls.inc(1, provider, model, outcome)
+    llm_latency.observe(seconds, provider, model)
+    if tokens_in:
+        llm_tokens.inc(tokens_in, model, "input")
+    if tokens_out:
+        llm_tokens.inc(tokens_out, model, "output")
+    _charge("llm", seconds)
+
+def record_throttle(model, seconds):
+    if enabled:
+        llm_throttle_wait.observe(seconds, model)
+        _charge("llm", seconds)
+
+def record_retry(model, sleep_seconds):
+    if enabled:
+        llm_retries.inc(1, model)
+        llm_retry_sleep.inc(sleep_seconds, model)
+        _charge("llm", sleep_seconds)
+
+def timed(section):
+    """Decorate a function to record its latency under ``section``."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                section_latency.observe(time.perf_counter() - started, section)
+        return wrapper
+    return decorate
+
+def _on_context_stats(event, stats):
+    if event == "turn" and stats.get("tokens_saved"):
+        tokens_saved.inc(stats["tokens_saved"])
+
+def _before_request():
+    _local.started = time.perf_counter()
+    _local.active = True
+    _local.db = _local.llm = 0.0
+
+def _after_request(response):
+    from flask import request
+
+    endpoint = request.endpoint or "unmatched"
+    http_requests.inc(1, endpoint, request.method, str(response.status_code))
+    if getattr(_local, "active", False):
+        http_latency.observe(time.perf_counter() - _local.started, endpoint)
+        if detailed:
+            request_db_time.observe(_local.db, endpoint)
+            request_llm_time.observe(_local.llm, endpoint)
+        _local.active = False
+    return response
+
+def _metrics_view():
+    from flask import Response
+    return Response(render(), mimetype="text/plain; version=0.0.4")
+
+def init_app(app):
+    """Install the request hooks and ``/metrics`` on ``app`` (unless METRICS=off)."""
+    if not enabled:
+        return
+    from . import conversation
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule("/metrics", "metrics", _metrics_view)
+    conversation.add_stats_hook(_on_context_stats)
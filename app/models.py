@@ -1,3 +1,7 @@
+import base64
+import json
+import time
+
 from flask_login import UserMixin
 # from bson import ObjectId # No longer needed
 
@@ -25,6 +29,14 @@ class User(UserMixin):
             return User(doc)
         return None
 
+    @staticmethod
+    def get_many(db, user_ids):
+        """Users for ``user_ids`` as a dict keyed by id, fetched in one pass."""
+        wanted = list({str(i) for i in user_ids})
+        if not wanted:
+            return {}
+        return {str(doc['_id']): User(doc) for doc in db.users.find({"_id": {"$in": wanted}})}
+
 class Question:
     def __init__(self, role, type, content, hr_id):
         self.role = role
@@ -48,8 +60,8 @@ class Question:
 
 class InterviewReport:
     @staticmethod
-    def create(db, student_id, role, score, summary, strengths, weaknesses, suggestion):
-        return db.reports.insert_one({
+    def create(db, student_id, role, score, summary, strengths, weaknesses, suggestion, report_id=None):
+        doc = {
             "student_id": student_id,
             "role": role,
             "score": score,
@@ -57,28 +69,87 @@ class InterviewReport:
             "strengths": strengths,
             "weaknesses": weaknesses,
             "suggestion": suggestion,
-            "date": "Today" # Use datetime in prod
-        })
+            "date": "Today", # Use datetime in prod
+            "created_at": time.time()
+        }
+        if report_id is not None:
+            doc["_id"] = report_id
+        result = db.reports.insert_one(doc)
 
-    @staticmethod
-    def get_all(db):
-        reports = list(db.reports.find())
-        # Sort by _id descending (latest first)
-        return sorted(reports, key=lambda x: x.get('_id', ''), reverse=True)
+        from . import log
+        from .analytics import record_report
+        try:
+            record_report(db, doc)
+        except Exception as e:
+            # The report itself is saved; `manage_db.py rebuild-analytics` catches the totals up
+            log.error("analytics", "report not counted", report=result.inserted_id, error=str(e))
+        return result
 
     @staticmethod
     def get_by_id(db, report_id):
         return db.reports.find_one({"_id": report_id})
 
+    @staticmethod
+    def page(db, role=None, min_score=None, max_score=None, cursor=None, limit=50):
+        """Newest reports first, ``limit`` at a time, without their long text fields.
+
+        ``cursor`` is the ``next_cursor`` of the previous page; returns
+        ``(reports, next_cursor)``, with ``next_cursor`` None on the last page.
+        """
+        query = {"role": role} if role else {}
+        score = {}
+        if min_score is not None:
+            score["$gte"] = min_score
+        if max_score is not None:
+            score["$lte"] = max_score
+        if score:
+            query["score"] = score
+
+        def fetch(extra, count):
+            return db.reports.find(dict(query, **extra), projection=LIST_FIELDS,
+                                   sort=[("created_at", -1), ("_id", -1)], limit=count)
+
+        if cursor is None:
+            reports = fetch({}, limit + 1)
+        else:
+            created_at, last_id = _decode_cursor(cursor)
+            # The rest of the cursor's created_at, then everything older;
+            # reports from before created_at existed come last
+            reports = fetch({"created_at": created_at, "_id": {"$lt": last_id}}, limit + 1)
+            if created_at is not None and len(reports) <= limit:
+                reports += fetch({"created_at": {"$lt": created_at}}, limit + 1 - len(reports))
+            if created_at is not None and len(reports) <= limit:
+                reports += fetch({"created_at": None}, limit + 1 - len(reports))
+
+        next_cursor = None
+        if len(reports) > limit:
+            reports = reports[:limit]
+            next_cursor = _encode_cursor((reports[-1].get('created_at'), str(reports[-1]['_id'])))
+        return reports, next_cursor
+
+# Report fields the dashboard lists (the long text fields stay behind)
+LIST_FIELDS = {"student_id": 1, "role": 1, "score": 1, "date": 1, "created_at": 1}
+
 class ActiveInterview:
+    # "setup" holds what the prompt is built from (role, type, difficulty and
+    # the resume's id in the resumes collection); messages after the prompt
+    # are appended to "turns" one exchange at a time.
+
     @staticmethod
-    def create(db, student_id, history):
+    def create(db, student_id, setup, turns, context_key=None):
         # Remove existing active interview for this student if any
         db.active_interviews.delete_many({"student_id": student_id})
         return db.active_interviews.insert_one({
             "student_id": student_id,
-            "history": history,
-            "updated_at": "now"
+            "setup": setup,
+            "context_key": context_key,
+            "turns": turns,
+            # Running summary of turns[:summarized], see app.conversation
+            "summary": None,
+            "summarized": 0,
+            "tokens_saved": 0,
+            "updated_at": "now",
+            "_rev": 0
         })
 
     @staticmethod
@@ -86,13 +157,145 @@ class ActiveInterview:
         return db.active_interviews.find_one({"student_id": student_id})
 
     @staticmethod
-    def update_history(db, student_id, history):
+    def get_history(interview):
+        """Rebuild the full chat history, prompt first, from an interview stored with its prompt inline."""
+        if "history" in interview:
+            # Saved before turns were stored separately
+            return list(interview["history"])
+        return [{"role": "user", "parts": [interview["prompt"]]}] + interview.get("turns", [])
+
+    @staticmethod
+    def append_turns(db, interview, turns, tokens_saved=0):
+        # Only save if no other request saved a turn since ``interview`` was read,
+        # and into that interview rather than one the student started since
+        field = "history" if "history" in interview else "turns"
         return db.active_interviews.update_one(
-            {"student_id": student_id},
-            {"$set": {"history": history, "updated_at": "now"}}
+            {"student_id": interview["student_id"], "_id": interview["_id"], "_rev": interview.get("_rev")},
+            {"$push": {field: {"$each": turns}}, "$set": {"updated_at": "now"},
+             "$inc": {"_rev": 1, "tokens_saved": tokens_saved}}
+        )
+
+    @staticmethod
+    def set_summary(db, interview, summary, summarized):
+        # Skip if another worker already moved the summary on, or the interview
+        # has ended (the student's next one starts at summarized=0 too);
+        # turns appended meanwhile are fine
+        return db.active_interviews.update_one(
+            {"student_id": interview["student_id"], "_id": interview["_id"], "summarized": interview.get("summarized")},
+            {"$set": {"summary": summary, "summarized": summarized}}
         )
 
     @staticmethod
     def delete_by_student(db, student_id):
         return db.active_interviews.delete_many({"student_id": student_id})
 
+class Resume:
+    # Parsed resumes keyed by the SHA-256 of the uploaded file (see app.resume)
+
+    @staticmethod
+    def create(db, digest, filename, text, pages, skipped_pages, truncated):
+        from .db import DuplicateKeyError
+
+        doc = {
+            "_id": digest,
+            "filename": filename,
+            "text": text,
+            "pages": pages,
+            "skipped_pages": skipped_pages,
+            "truncated": truncated,
+            "created_at": time.time()
+        }
+        try:
+            db.resumes.insert_one(dict(doc))
+        except DuplicateKeyError:
+            # Someone uploaded the same file meanwhile; theirs is the same text
+            pass
+        return doc
+
+    @staticmethod
+    def get_by_id(db, resume_id):
+        return db.resumes.find_one({"_id": resume_id})
+
+def _encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+def _decode_cursor(cursor):
+    try:
+        created_at, _id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (created_at, _id)
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+class Job:
+    # Background work persisted in the DB; see app.jobs for the workers.
+    # status: queued -> running -> done | failed (back to queued on a retry)
+
+    @staticmethod
+    def create(db, kind, payload, owner=None):
+        now = time.time()
+        return db.jobs.insert_one({
+            "kind": kind,
+            "owner": owner,
+            "payload": payload,
+            "status": "queued",
+            "attempts": 0,
+            "run_at": now,
+            "lease_until": None,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now
+        })
+
+    @staticmethod
+    def get_by_id(db, job_id):
+        return db.jobs.find_one({"_id": job_id})
+
+    @staticmethod
+    def claim(db, job, lease):
+        # Conditional on the fields we saw, so only one worker wins the job
+        now = time.time()
+        return db.jobs.update_one(
+            {"_id": job["_id"], "status": job["status"], "attempts": job["attempts"]},
+            {"$set": {"status": "running", "lease_until": now + lease, "updated_at": now},
+             "$inc": {"attempts": 1}}
+        )
+
+    @staticmethod
+    def finish(db, job_id, result):
+        return db.jobs.update_one(
+            {"_id": job_id},
+            # The payload (a whole transcript, for reports) is no longer needed
+            {"$set": {"status": "done", "result": result, "error": None, "payload": None, "updated_at": time.time()}}
+        )
+
+    @staticmethod
+    def retry(db, job_id, error, delay):
+        now = time.time()
+        return db.jobs.update_one(
+            {"_id": job_id},
+            {"$set": {"status": "queued", "run_at": now + delay, "error": error, "updated_at": now}}
+        )
+
+    @staticmethod
+    def fail(db, job_id, error):
+        return db.jobs.update_one(
+            {"_id": job_id},
+            # Kept: for reports the payload is the only copy of the interview, needed to requeue it
+            {"$set": {"status": "failed", "error": error, "updated_at": time.time()}}
+        )
+
+    @staticmethod
+    def requeue_failed(db, kind=None):
+        """Give failed jobs (of ``kind``) a fresh set of attempts; returns how many were requeued."""
+        query = {"status": "failed"}
+        if kind:
+            query["kind"] = kind
+        count = 0
+        for job in db.jobs.find(query, projection={"_id": 1}):
+            now = time.time()
+            count += bool(db.jobs.update_one(
+                {"_id": job["_id"], "status": "failed"},
+                {"$set": {"status": "queued", "attempts": 0, "run_at": now, "lease_until": None, "updated_at": now}}
+            ))
+        return count
@@ -0,0 +1,132 @@
+"""Opt-in cProfile capture of single live requests.
+
+Set PROFILE_TOKEN to enable. A request carrying ``X-Profile: <token>`` (or
+``?profile=<token>``) on any route is run under cProfile and the stats are
+saved to PROFILE_DIR; the response names the file in ``X-Profile-Id``.
+Profiling stops when the response is closed, so streamed bodies are
+included. Only the newest PROFILE_MAX_FILES profiles are kept.
+
+``/admin/profiles`` lists them and ``/admin/profiles/<name>`` downloads one
+(pstats format, e.g. for ``snakeviz``) or, with ``?format=text``, shows the
+top functions by cumulative time. Both need the token too.
+
+Without PROFILE_TOKEN no hooks are installed, so requests pay nothing, and
+the profiler modules are not even imported.
+"""
+import hmac
+import io
+import os
+import re
+import time
+import uuid
+
+from . import log
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+# Rows shown by the text view
+TEXT_ROWS = 60
+
+_NAME = re.compile(r"^[\w.-]+\.prof$")
+
+def _authorized():
+    from flask import request
+
+    token = request.headers.get("X-Profile") or request.args.get("profile") or ""
+    return hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+def _rotate():
+    names = sorted(list_profiles(), key=lambda p: p["created"])
+    for profile in names[:max(len(names) - PROFILE_MAX_FILES, 0)]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, profile["name"]))
+        except OSError:
+            pass
+
+def _save(profiler, name, started):
+    import pstats
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    pstats.Stats(profiler).dump_stats(os.path.join(PROFILE_DIR, name))
+    log.event("profile", "profiled request", profile=name, seconds=round(time.perf_counter() - started, 3))
+    _rotate()
+
+def list_profiles():
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILE_DIR):
+        if _NAME.match(name):
+            st = os.stat(os.path.join(PROFILE_DIR, name))
+            profiles.append({"name": name, "size": st.st_size, "created": st.st_mtime})
+    return sorted(profiles, key=lambda p: p["created"], reverse=True)
+
+def _before_request():
+    from flask import g, request
+
+    if request.endpoint in ("profiles", "profile") or not _authorized():
+        return
+    import cProfile
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except (ValueError, RuntimeError) as e:
+        # Another profile is still running on this thread (or, from 3.12, in this process)
+        log.warning("profile", "profiling skipped", error=str(e))
+        return
+    g.profiler = (profiler, time.perf_counter())
+
+def _after_request(response):
+    from flask import g, request
+
+    active = g.pop("profiler", None)
+    if active is None:
+        return response
+    profiler, started = active
+    endpoint = re.sub(r"[^\w.-]", "_", request.endpoint or "unmatched")
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{uuid.uuid4().hex[:8]}.prof"
+
+    def finish():
+        profiler.disable()
+        try:
+            _save(profiler, name, started)
+        except Exception as e:
+            log.error("profile", "profile save failed", profile=name, error=str(e))
+
+    # Stop once the body has been sent, so streamed responses are covered too
+    response.call_on_close(finish)
+    response.headers["X-Profile-Id"] = name
+    return response
+
+def _list_view():
+    from flask import jsonify
+
+    if not _authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify(list_profiles())
+
+def _download_view(name):
+    from flask import Response, jsonify, request, send_from_directory
+
+    if not _authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    if not _NAME.match(name) or not os.path.exists(os.path.join(PROFILE_DIR, name)):
+        return jsonify({"error": "Profile not found"}), 404
+    if request.args.get("format") == "text":
+        import pstats
+
+        out = io.StringIO()
+        pstats.Stats(os.path.join(PROFILE_DIR, name), stream=out).sort_stats("cumulative").print_stats(TEXT_ROWS)
+        return Response(out.getvalue(), mimetype="text/plain")
+    return send_from_directory(os.path.abspath(PROFILE_DIR), name, as_attachment=True)
+
+def init_app(app):
+    """Install the profiling hooks and routes on ``app`` when PROFILE_TOKEN is set."""
+    if not PROFILE_TOKEN:
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule("/admin/profiles", "profiles", _list_view)
+    app.add_url_rule("/admin/profiles/<name>", "profile", _download_view)
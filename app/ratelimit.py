@@ -0,0 +1,236 @@
+"""Client-side quota limiter for model calls.
+
+Each model gets two token buckets, requests per minute and input tokens per
+minute, refilled continuously so calls go out just under quota instead of
+hitting 429s and sleeping blindly. Callers wait in a priority queue, so the
+start of an interview and its final report are served before mid-interview
+turns. When the server still answers 429, its "retry in N s" hint pauses
+the model's queue for that long.
+
+Limits come from DEFAULT_LIMITS, overridden by LLM_RATE_LIMITS, e.g.
+``LLM_RATE_LIMITS="gemini-2.5-flash=10/250000,gpt-4o=500/30000"``
+(requests/input tokens per minute; 0 means unlimited). Models without a
+limit are not throttled.
+
+By default bucket state is per process. Set LLM_RATE_LIMIT_DB to a SQLite
+file to share it between worker processes; the priority queue still
+orders callers within each process.
+"""
+import heapq
+import itertools
+import os
+import re
+import threading
+import time
+
+# Priorities: lower goes first
+HIGH = 0    # interview start and end-of-interview report
+NORMAL = 1  # mid-interview turns
+LOW = 2     # background work that can wait
+
+# Free-tier quotas as (requests, input tokens) per minute
+DEFAULT_LIMITS = {
+    "gemini-2.5-flash": (10, 250000),
+}
+
+# Give up (and surface a 429) rather than hold a request longer than this
+MAX_WAIT = float(os.getenv("LLM_RATE_LIMIT_MAX_WAIT", "60"))
+# Aim a little under the quota to leave room for clock skew between us and the server
+HEADROOM = 0.95
+
+_RETRY_RES = [
+    re.compile(r'retry in ([\d.]+)\s*s', re.I),
+    re.compile(r'retry_delay\s*\{\s*seconds:\s*(\d+)'),
+]
+
+class RateLimitError(Exception):
+    """A 429 / quota error, from the server or from our own limiter giving up."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def is_quota_error(error):
+    return isinstance(error, RateLimitError) or "429" in str(error) or "ResourceExhausted" in str(error)
+
+def retry_after(error):
+    """Seconds the server asked us to wait, if it said."""
+    seconds = getattr(error, "retry_after", None)
+    if seconds is not None:
+        return seconds
+    for pattern in _RETRY_RES:
+        match = pattern.search(str(error))
+        if match:
+            return float(match.group(1))
+    return None
+
+def estimate_tokens(messages, system=None):
+    # ~4 characters per token is close enough for budgeting
+    chars = len(system or "")
+    for m in messages:
+        chars += sum(len(str(part)) for part in m.get("parts", []))
+    return chars // 4 + 1
+
+def parse_limits(spec):
+    limits = {}
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        model, _, values = item.partition("=")
+        rpm, _, tpm = values.partition("/")
+        limits[model.strip()] = (int(rpm or 0), int(tpm or 0))
+    return limits
+
+class MemoryBuckets:
+    """Bucket levels for one model, held in this process."""
+
+    def __init__(self, model, rpm, tpm):
+        self.limits = {"requests": rpm * HEADROOM, "tokens": tpm * HEADROOM}
+        self.levels = dict(self.limits)
+        self.updated = time.time()
+        self.blocked_until = 0.0
+
+    def try_take(self, tokens):
+        """Take one request and ``tokens`` if available; else return seconds to wait."""
+        now = time.time()
+        for kind, limit in self.limits.items():
+            if limit:
+                self.levels[kind] = min(limit, self.levels[kind] + (now - self.updated) * limit / 60)
+        self.updated = now
+        wait = _wait(self.limits, self.levels, tokens, self.blocked_until - now)
+        if wait <= 0:
+            self.levels["requests"] -= 1
+            self.levels["tokens"] -= tokens
+        return wait
+
+    def block(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.time() + seconds)
+        # The server thinks we are over quota, so start refilling from empty
+        self.levels = {kind: 0.0 for kind in self.levels}
+
+class SQLiteBuckets:
+    """Bucket levels for one model, shared through a SQLite file."""
+
+    def __init__(self, model, rpm, tpm, path):
+        self.model = model
+        self.limits = {"requests": rpm * HEADROOM, "tokens": tpm * HEADROOM}
+        self.path = path
+        self._local = threading.local()
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_quota "
+                "(model TEXT PRIMARY KEY, requests REAL, tokens REAL, updated REAL, blocked_until REAL)"
+            )
+            conn.execute("INSERT OR IGNORE INTO llm_quota VALUES (?, ?, ?, ?, 0)",
+                         (model, self.limits["requests"], self.limits["tokens"], time.time()))
+
+    def _transaction(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            import sqlite3
+
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        return _Immediate(conn)
+
+    def try_take(self, tokens):
+        with self._transaction() as conn:
+            requests_level, tokens_level, updated, blocked_until = conn.execute(
+                "SELECT requests, tokens, updated, blocked_until FROM llm_quota WHERE model = ?", (self.model,)
+            ).fetchone()
+            now = time.time()
+            levels = {"requests": requests_level, "tokens": tokens_level}
+            for kind, limit in self.limits.items():
+                if limit:
+                    levels[kind] = min(limit, levels[kind] + (now - updated) * limit / 60)
+            wait = _wait(self.limits, levels, tokens, blocked_until - now)
+            if wait <= 0:
+                levels["requests"] -= 1
+                levels["tokens"] -= tokens
+            conn.execute("UPDATE llm_quota SET requests = ?, tokens = ?, updated = ? WHERE model = ?",
+                         (levels["requests"], levels["tokens"], now, self.model))
+        return wait
+
+    def block(self, seconds):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE llm_quota SET requests = 0, tokens = 0, updated = ?, "
+                "blocked_until = MAX(blocked_until, ?) WHERE model = ?",
+                (time.time(), time.time() + seconds, self.model)
+            )
+
+def _wait(limits, levels, tokens, blocked_for):
+    wait = max(blocked_for, 0.0)
+    for kind, needed in (("requests", 1), ("tokens", tokens)):
+        limit = limits[kind]
+        if limit:
+            # A single call larger than the whole bucket only has to wait for a full one
+            needed = min(needed, limit)
+            if levels[kind] < needed:
+                wait = max(wait, (needed - levels[kind]) * 60 / limit)
+    return wait
+
+class _Immediate:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+class ModelLimiter:
+    """Priority queue in front of one model's buckets."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._cond = threading.Condition()
+        self._queue = []
+        self._tickets = itertools.count()
+
+    def acquire(self, tokens, priority=NORMAL, max_wait=MAX_WAIT):
+        deadline = time.time() + max_wait
+        with self._cond:
+            ticket = (priority, next(self._tickets))
+            heapq.heappush(self._queue, ticket)
+            try:
+                while True:
+                    wait = None
+                    if self._queue[0] == ticket:
+                        wait = self.buckets.try_take(tokens)
+                        if wait <= 0:
+                            return
+                    remaining = deadline - time.time()
+                    if remaining <= 0 or (wait is not None and wait > remaining):
+                        raise RateLimitError("429 Local rate limit: quota wait too long", retry_after=wait)
+                    # Callers behind the head sleep until it leaves the queue
+                    self._cond.wait(remaining if wait is None else wait)
+            finally:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+
+    def block(self, seconds):
+        with self._cond:
+            self.buckets.block(seconds)
+            self._cond.notify_all()
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(model):
+    """The limiter for ``model``, or None when it has no configured quota."""
+    limiter = _limiters.get(model)
+    if limiter is None and model not in _limiters:
+        with _limiters_lock:
+            if model not in _limiters:
+                limits = dict(DEFAULT_LIMITS, **parse_limits(os.getenv("LLM_RATE_LIMITS", "")))
+                rpm, tpm = limits.get(model, (0, 0))
+                if not rpm and not tpm:
+                    _limiters[model] = None
+                else:
+                    path = os.getenv("LLM_RATE_LIMIT_DB")
+                    buckets = SQLiteBuckets(model, rpm, tpm, path) if path else MemoryBuckets(model, rpm, tpm)
+                    _limiters[model] = ModelLimiter(buckets)
+            limiter = _limiters[model]
+    return limiter
@@ -0,0 +1,237 @@
+"""Resume ingestion: upload -> text, bounded and cached.
+
+The upload is streamed to a temporary file while its SHA-256 is computed;
+a resume already parsed once (by anyone) is served from the ``resumes``
+collection without touching the file again. New PDFs are parsed page by
+page in a process pool, so a slow or hostile file never runs on a request
+thread. Each page has a time limit and only the first RESUME_MAX_PAGES
+pages and RESUME_MAX_CHARS characters are kept.
+
+This module is imported by the pool's worker processes, so keep its
+module-level imports light.
+"""
+import hashlib
+import os
+import signal
+import tempfile
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+
+RESUME_MAX_BYTES = int(os.getenv("RESUME_MAX_BYTES", str(5 * 1024 * 1024)))
+RESUME_MAX_PAGES = int(os.getenv("RESUME_MAX_PAGES", "20"))
+RESUME_MAX_CHARS = int(os.getenv("RESUME_MAX_CHARS", "20000"))
+# Seconds allowed for extracting one page
+PAGE_TIMEOUT = float(os.getenv("RESUME_PAGE_TIMEOUT", "5"))
+RESUME_WORKERS = int(os.getenv("RESUME_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+CHUNK_SIZE = 64 * 1024
+EXTENSIONS = ('.pdf', '.txt')
+
+class ResumeError(Exception):
+    """The upload cannot be turned into resume text; the message is user-facing."""
+
+# --- Worker process side ---
+
+_reader = (None, None)
+
+def _open(path):
+    # Pages of one file usually land on the same worker; parse its structure once
+    global _reader
+    if _reader[0] != path:
+        from pypdf import PdfReader
+        _reader = (path, PdfReader(path))
+    return _reader[1]
+
+def _on_alarm(signum, frame):
+    raise TimeoutError("page extraction timed out")
+
+def _with_timeout(fn, *args):
+    # Interrupt the parser itself, so a stuck page does not keep the worker busy
+    if not hasattr(signal, "setitimer"):
+        return fn(*args)
+    signal.signal(signal.SIGALRM, _on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, PAGE_TIMEOUT)
+    try:
+        return fn(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+def _page_count(path):
+    return _with_timeout(lambda: len(_open(path).pages))
+
+def _extract_page(path, index):
+    return _with_timeout(lambda: _open(path).pages[index].extract_text() or "")
+
+# --- Request side ---
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # Loaded here so processes that never parse a PDF skip them
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+
+                # fork keeps workers from re-running the app's entry script
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+                _pool = ProcessPoolExecutor(max_workers=RESUME_WORKERS, mp_context=context)
+    return _pool
+
+def _recycle_pool(pool, kill=False):
+    """Stop handing out ``pool``; with ``kill``, also end its workers (one may be stuck on a page)."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    if kill:
+        # A parser stuck in C code never sees the page alarm, and the
+        # executor has no public way to stop a busy worker
+        for process in list((getattr(pool, "_processes", None) or {}).values()):
+            process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _spool(stream, directory=None):
+    """Copy an upload stream to a temp file; return (path, sha256 hex)."""
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(prefix="resume-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                size += len(chunk)
+                if size > RESUME_MAX_BYTES:
+                    raise ResumeError(f"File too large (max {RESUME_MAX_BYTES // (1024 * 1024)} MB).")
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, digest.hexdigest()
+
+# How often a waiting request checks whether its page has reached a worker
+POLL_INTERVAL = 0.1
+
+class _Stuck(Exception):
+    """A page ran past its limit in a worker that ignored the alarm."""
+
+def _wait(future, grace):
+    """The page's result; the clock starts once a worker has it, not while it queues behind other uploads."""
+    running_since = None
+    while True:
+        try:
+            return future.result(timeout=POLL_INTERVAL)
+        except (TimeoutError, FutureTimeout):
+            if future.done():
+                # The worker's own page alarm
+                raise
+        if running_since is None:
+            if future.running():
+                running_since = time.monotonic()
+        elif time.monotonic() - running_since > grace:
+            raise _Stuck("page extraction did not stop")
+
+def _parse_pdf(path):
+    from concurrent.futures import CancelledError
+    from concurrent.futures.process import BrokenProcessPool
+
+    for attempt in range(2):
+        pool = _get_pool()
+        try:
+            return _parse_pdf_with(pool, path)
+        except (BrokenProcessPool, CancelledError):
+            # A worker died (out of memory, or crashed on a hostile file), or
+            # another request replaced a stuck one; the pool is unusable from
+            # then on, so start a new one
+            _recycle_pool(pool)
+    raise ResumeError("Could not read this PDF.")
+
+def _parse_pdf_with(pool, path):
+    from concurrent.futures import CancelledError
+    from concurrent.futures.process import BrokenProcessPool
+
+    # The parent only ever sees the text, never the PDF structure. Each page
+    # is limited by the alarm in its worker; the grace period (which also
+    # covers the one call the executor queues ahead of it) only catches a
+    # worker that ignored the alarm
+    grace = 2 * PAGE_TIMEOUT + 5
+    try:
+        pages = _wait(pool.submit(_page_count, path), grace)
+    except _Stuck:
+        _recycle_pool(pool, kill=True)
+        raise ResumeError("This PDF took too long to open.")
+    except (TimeoutError, FutureTimeout):
+        raise ResumeError("This PDF took too long to open.")
+    except (BrokenProcessPool, CancelledError):
+        raise
+    except Exception as e:
+        raise ResumeError(f"Could not read this PDF: {e}")
+
+    futures = [pool.submit(_extract_page, path, i) for i in range(min(pages, RESUME_MAX_PAGES))]
+    texts, skipped, stuck = [], 0, False
+    for future in futures:
+        try:
+            texts.append(_wait(future, grace))
+        except (BrokenProcessPool, CancelledError):
+            raise
+        except Exception as e:
+            # One unreadable page should not cost the whole resume
+            from . import log
+            log.warning("resume", "page extraction failed", error=str(e))
+            stuck = stuck or isinstance(e, _Stuck)
+            skipped += 1
+    if stuck:
+        # The worker is still busy with that page; replace it rather than lose it for good
+        _recycle_pool(pool, kill=True)
+    if futures and skipped == len(futures):
+        raise ResumeError("Could not read any page of this PDF.")
+    return "\n".join(texts), pages, skipped
+
+def _parse_txt(path):
+    with open(path, "rb") as f:
+        return f.read(RESUME_MAX_CHARS * 4).decode("utf-8", errors="replace"), 1, 0
+
+def parse(path, filename):
+    if filename.lower().endswith(".pdf"):
+        text, pages, skipped = _parse_pdf(path)
+    else:
+        text, pages, skipped = _parse_txt(path)
+    return {
+        "text": text.strip()[:RESUME_MAX_CHARS],
+        "pages": pages,
+        "skipped_pages": skipped,
+        "truncated": pages > RESUME_MAX_PAGES or len(text.strip()) > RESUME_MAX_CHARS
+    }
+
+def ingest(db, file):
+    """Turn an uploaded ``FileStorage`` into a stored resume document."""
+    from .models import Resume
+
+    if not file.filename.lower().endswith(EXTENSIONS):
+        raise ResumeError("Unsupported file format. Please upload PDF or TXT.")
+
+    path, digest = _spool(file.stream)
+    try:
+        cached = Resume.get_by_id(db, digest)
+        if cached:
+            return cached
+        parsed = parse(path, file.filename)
+        if parsed["skipped_pages"]:
+            # Keyed by the text instead, so the next upload of this file reads it again
+            digest = hashlib.sha256(parsed["text"].encode("utf-8")).hexdigest()
+        return Resume.create(db, digest, file.filename, **parsed)
+    finally:
+        os.remove(path)
+
+def store_text(db, text):
+    """Store resume text given directly (not as a file), keyed by its own hash."""
+    from .models import Resume
+
+    text = text.strip()[:RESUME_MAX_CHARS]
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return Resume.get_by_id(db, digest) or Resume.create(db, digest, None, text, 1, 0, False)
@@ -1,10 +1,14 @@
-from flask import Blueprint, render_template, request, redirect, flash, url_for
+from flask import Blueprint, render_template, request, redirect, flash, url_for, jsonify
 from flask_login import login_required, current_user
 from ..db import get_db
 from ..models import Question, InterviewReport, User
+from .. import analytics
 
 hr_dashboard_bp = Blueprint('hr_dashboard', __name__)
 
+# Reports per dashboard page
+PAGE_SIZE = 50
+
 @hr_dashboard_bp.route('/hr/dashboard')
 @login_required
 def dashboard():
@@ -12,20 +16,43 @@ def dashboard():
         return redirect(url_for('hr_auth.login'))
         
     db = get_db()
+
+    filters = {
+        "role": request.args.get('role') or None,
+        "min_score": request.args.get('min_score', type=int),
+        "max_score": request.args.get('max_score', type=int),
+    }
     
-    # Fetch Reports
-    reports = InterviewReport.get_all(db)
+    # Fetch one page of reports
+    try:
+        reports, next_cursor = InterviewReport.page(db, cursor=request.args.get('cursor'),
+                                                    limit=PAGE_SIZE, **filters)
+    except ValueError:
+        flash("That page link has expired.")
+        return redirect(url_for('hr_dashboard.dashboard'))
     
-    # Helper to get user names
-    enriched_reports = []
+    # Look up all the page's students at once rather than one query per report
+    students = User.get_many(db, {r['student_id'] for r in reports})
     for r in reports:
         # student_id is stored as string in this JsonDB
-        student = User.get_by_id(db, r['student_id'])
+        student = students.get(str(r['student_id']))
         r['student_name'] = student.name if student else "Unknown"
         r['id'] = str(r['_id'])
-        enriched_reports.append(r)
 
-    return render_template('hr_dashboard.html', reports=enriched_reports, user=current_user)
+    filters = {k: v for k, v in filters.items() if v is not None}
+    next_url = url_for('hr_dashboard.dashboard', cursor=next_cursor, **filters) if next_cursor else None
+    return render_template('hr_dashboard.html', reports=reports, user=current_user,
+                           filters=filters, next_url=next_url,
+                           first_url=url_for('hr_dashboard.dashboard', **filters) if request.args.get('cursor') else None)
+
+@hr_dashboard_bp.route('/hr/analytics')
+@login_required
+def analytics_summary():
+    """Score distributions, interviews per day and top weaknesses, overall and per role."""
+    if current_user.role != 'hr':
+        return jsonify({"error": "Forbidden"}), 403
+
+    return jsonify(analytics.get_summary(get_db(), role=request.args.get('role')))
 
 @hr_dashboard_bp.route('/hr/add-question', methods=['POST'])
 @login_required
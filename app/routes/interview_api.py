@@ -1,14 +1,11 @@
-from flask import Blueprint, request, jsonify, session
-import google.generativeai as genai
-import os
+from flask import Blueprint, request, jsonify, session, Response, stream_with_context
 import json
+import re
+import uuid
+from .. import conversation, jobs, llm, log, metrics, ratelimit
 
 interview_api_bp = Blueprint('interview_api', __name__)
 
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "dummy-key")
-if GOOGLE_API_KEY != "dummy-key":
-    genai.configure(api_key=GOOGLE_API_KEY)
-
 SYSTEM_PROMPT_TEMPLATE = """You are a professional AI Interviewer for a {role} position.
 Interview Type: {interview_type}
 Current Interface Difficulty: {difficulty}
@@ -34,54 +31,74 @@ Rules:
 }}
 """
 
-def get_gemini_model():
-    return genai.GenerativeModel('gemini-2.5-flash')
+START_INSTRUCTION = "Start the interview. Introduce yourself briefly as the AI Interviewer and ask the first question (e.g., 'Tell me about yourself')."
 
 @interview_api_bp.route('/api/interview/start', methods=['POST'])
 def start_interview():
     data = request.json
     role = data.get('role', 'Candidate')
     interview_type = data.get('type', 'Technical')
-    resume_text = data.get('resume_text', 'No resume provided.')
+    resume_id = data.get('resume_id')
     difficulty = data.get('difficulty', 'Medium')
-
-    full_system_prompt = SYSTEM_PROMPT_TEMPLATE.format(
-        role=role,
-        interview_type=interview_type,
-        difficulty=difficulty,
-        resume_text=resume_text
-    )
-
-    # Initialize chat history with system prompt
-    history = [
-        {"role": "user", "parts": [full_system_prompt + "\n\nStart the interview. Introduce yourself briefly as the AI Interviewer and ask the first question (e.g., 'Tell me about yourself')."]}
-    ]
-    print(history)
     
     # Use DB instead of Session
     from ..db import get_db
-    from ..models import ActiveInterview
+    from ..models import ActiveInterview, Resume
+    from ..resume import store_text
     from flask_login import current_user
     
     db = get_db()
     # Ensure we have a user ID (even if anonymous for some reason, though app requires login)
     user_id = current_user.id if current_user.is_authenticated else "anonymous_session" # Ideally should be session ID if anonymous
-    
+
+    if resume_id:
+        if not Resume.get_by_id(db, resume_id):
+            return jsonify({"error": "Resume not found. Please upload it again.", "question": "", "feedback": ""}), 400
+    else:
+        # Pasted text (and older clients) are stored the same way as an upload
+        resume_id = store_text(db, data.get('resume_text') or 'No resume provided.')["_id"]
+
+    # The interview keeps only these; the prompt is rebuilt from them when a call needs it
+    setup = {"role": role, "interview_type": interview_type, "difficulty": difficulty, "resume_id": resume_id}
+    # Keyed per interview, so ending one never deletes a cache another interview is still using
+    context = _setup_context(setup, llm.context_key("interview", str(uuid.uuid4())))
+    history = []
+
     try:
-        response_data = _get_gemini_response(history)
+        response_data = _get_gemini_response(history, priority=ratelimit.HIGH, context=context)
         # Add assistant response to history
         history.append({"role": "model", "parts": [json.dumps(response_data)]})
         
         # Save to DB
-        ActiveInterview.create(db, user_id, history)
+        ActiveInterview.create(db, user_id, setup, history, context_key=context.key)
         
         return jsonify(response_data)
     except Exception as e:
         fallback_data = {"error": str(e), "question": "Hello. I'm ready to interview you. Could you introduce yourself?", "feedback": ""}
         history.append({"role": "model", "parts": [json.dumps(fallback_data)]})
-        ActiveInterview.create(db, user_id, history)
+        ActiveInterview.create(db, user_id, setup, history, context_key=context.key)
         return jsonify(fallback_data)
 
+def _setup_context(setup, key=None):
+    """The prompt prefix for an interview setup; the resume is only read if the text is needed."""
+    def build():
+        from ..db import get_db
+        from ..models import Resume
+
+        resume = Resume.get_by_id(get_db(), setup["resume_id"])
+        full_system_prompt = SYSTEM_PROMPT_TEMPLATE.format(
+            role=setup["role"],
+            interview_type=setup["interview_type"],
+            difficulty=setup["difficulty"],
+            resume_text=resume["text"] if resume else "No resume provided."
+        )
+        return full_system_prompt + "\n\n" + START_INSTRUCTION
+
+    if key is None:
+        # Interviews saved without their own key share one per setup (resume_id is a content hash)
+        key = llm.context_key(setup["role"], setup["interview_type"], setup["difficulty"], setup["resume_id"])
+    return llm.Context(key, build)
+
 @interview_api_bp.route('/api/interview/chat', methods=['POST'])
 def chat_interview():
     data = request.json
@@ -96,21 +113,28 @@ def chat_interview():
     
     active_session = ActiveInterview.get_by_student(db, user_id)
 
-    if not active_session or 'history' not in active_session:
+    if not active_session:
         # Fallback to check session just in case, or error out
         return jsonify({"error": "Session expired", "question": "Please restart the interview.", "feedback": ""}), 400
 
-    history = active_session['history']
+    context, history = _interview_context(active_session)
 
     # Append user answer
-    history.append({"role": "user", "parts": [user_answer]})
+    user_turn = {"role": "user", "parts": [user_answer]}
+    history.append(user_turn)
+    # Older turns go in as a summary, so input stays bounded however long the interview runs
+    messages, saved = conversation.build(active_session, history)
 
     try:
-        response_data = _get_gemini_response(history)
-        history.append({"role": "model", "parts": [json.dumps(response_data)]})
-        print("history",history)
-        # Update DB
-        ActiveInterview.update_history(db, user_id, history)
+        response_data = _get_gemini_response(messages, context=context)
+        conversation.record_turn(user_id, history, messages, saved)
+        model_turn = {"role": "model", "parts": [json.dumps(response_data)]}
+        history.append(model_turn)
+        _log_turn(active_session, history, messages, saved, response_data)
+        # Update DB with just this exchange
+        if not ActiveInterview.append_turns(db, active_session, [user_turn, model_turn], tokens_saved=saved):
+            return _conflict_response()
+        conversation.refresh_summary_async(db, active_session, history)
         
         return jsonify(response_data)
     except Exception as e:
@@ -120,14 +144,157 @@ def chat_interview():
             "question": "Could you elaborate further on your previous experience?",
             "error": str(e)
         }
-        history.append({"role": "model", "parts": [json.dumps(fallback_data)]})
-        ActiveInterview.update_history(db, user_id, history)
+        model_turn = {"role": "model", "parts": [json.dumps(fallback_data)]}
+        if not ActiveInterview.append_turns(db, active_session, [user_turn, model_turn]):
+            return _conflict_response()
         return jsonify(fallback_data)
 
+# Another answer was saved while this one waited on the model; keep that one
+CONFLICT_DATA = {
+    "error": "Conflict",
+    "feedback": "",
+    "question": "Sorry, two answers arrived at once. Could you repeat your last answer?"
+}
+
+def _conflict_response():
+    return jsonify(CONFLICT_DATA), 409
+
+def _log_turn(interview, history, messages, saved, response_data, streamed=False):
+    """Log a finished exchange by its turn id and sizes; the text only goes to the transcript log."""
+    log.event("turn", "chat turn", interview=str(interview["_id"]), student=interview.get("student_id"),
+              turn=len(history), streamed=streamed,
+              answer_chars=len(history[-2]["parts"][0]), reply_chars=len(history[-1]["parts"][0]),
+              sent_messages=len(messages), tokens_saved=saved)
+    log.transcript("turn", "chat turn", interview=str(interview["_id"]), turn=len(history),
+                   messages=messages, reply=response_data)
+
+def _interview_context(interview):
+    """Split a stored interview into its cached prompt prefix and the turns after it."""
+    from ..models import ActiveInterview
+
+    if "setup" in interview:
+        return _setup_context(interview["setup"], interview.get("context_key")), list(interview.get("turns", []))
+
+    # Saved with the prompt text inline, before interviews referenced their resume
+    history = ActiveInterview.get_history(interview)
+    prompt = history[0]["parts"][0]
+    # Interviews saved before prefixes were cached are keyed by the prompt itself
+    key = interview.get("context_key") or llm.context_key(prompt)
+    return llm.Context(key, prompt), history[1:]
+
+@interview_api_bp.route('/api/interview/chat/stream', methods=['POST'])
+def chat_interview_stream():
+    """Same as /api/interview/chat, but streams the reply as server-sent events.
+
+    ``delta`` events carry ``{"field": "feedback" | "question", "text": ...}``
+    as the model writes those fields; a final ``done`` event carries the
+    whole response once the turn is saved.
+    """
+    data = request.json
+    user_answer = data.get('answer', '')
+
+    from ..db import get_db
+    from ..models import ActiveInterview
+    from flask_login import current_user
+
+    db = get_db()
+    user_id = current_user.id if current_user.is_authenticated else "anonymous_session"
+
+    active_session = ActiveInterview.get_by_student(db, user_id)
+
+    if not active_session:
+        return jsonify({"error": "Session expired", "question": "Please restart the interview.", "feedback": ""}), 400
+
+    context, history = _interview_context(active_session)
+    user_turn = {"role": "user", "parts": [user_answer]}
+    history.append(user_turn)
+    messages, saved = conversation.build(active_session, history)
+
+    def events():
+        fields = _JsonFieldStream(("feedback", "question"))
+        text = ""
+        tokens_saved = 0
+        try:
+            for chunk in _stream_gemini_response(messages, context):
+                text += chunk
+                for field, delta in fields.feed(chunk):
+                    yield _sse("delta", {"field": field, "text": delta})
+            conversation.record_turn(user_id, history, messages, saved)
+            tokens_saved = saved
+            response_data = _parse_json_from_text(text)
+            if not response_data.get("question"):
+                raise ValueError("Model reply has no question")
+            _log_turn(active_session, history + [{"role": "model", "parts": [text]}], messages, saved,
+                      response_data, streamed=True)
+        except Exception as e:
+            response_data = {
+                "feedback": "I didn't quite catch that.",
+                "question": "Could you elaborate further on your previous experience?",
+                "error": str(e)
+            }
+
+        model_turn = {"role": "model", "parts": [json.dumps(response_data)]}
+        if ActiveInterview.append_turns(db, active_session, [user_turn, model_turn], tokens_saved=tokens_saved):
+            conversation.refresh_summary_async(db, active_session, history + [model_turn])
+        else:
+            response_data = CONFLICT_DATA
+        yield _sse("done", response_data)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+class _JsonFieldStream:
+    """Pull string fields out of a JSON object while it is still being streamed.
+
+    ``feed`` takes the next chunk of raw model output and returns
+    ``(field, text)`` pairs for whatever new text each field has gained.
+    """
+
+    def __init__(self, fields):
+        self.buffer = ""
+        self.sent = {field: 0 for field in fields}
+        self.patterns = {field: re.compile(r'"%s"\s*:\s*"' % re.escape(field)) for field in fields}
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        deltas = []
+        for field, pattern in self.patterns.items():
+            match = pattern.search(self.buffer)
+            if not match:
+                continue
+            value = self._decode(match.end())
+            if len(value) > self.sent[field]:
+                deltas.append((field, value[self.sent[field]:]))
+                self.sent[field] = len(value)
+        return deltas
+
+    def _decode(self, start):
+        # Find the closing quote, or take what has arrived so far
+        i = start
+        while i < len(self.buffer):
+            if self.buffer[i] == "\\":
+                i += 2
+            elif self.buffer[i] == '"':
+                break
+            else:
+                i += 1
+        raw = self.buffer[start:min(i, len(self.buffer))]
+        # An escape sequence may be cut off at the end; drop characters until it decodes
+        for cut in range(min(len(raw), 6) + 1):
+            try:
+                return json.loads('"' + raw[:len(raw) - cut] + '"')
+            except ValueError:
+                continue
+        return ""
+
 @interview_api_bp.route('/api/interview/end', methods=['POST'])
 def end_interview():
+    """Queue the report and return at once; /report?job=<id> waits for it."""
     from ..db import get_db
-    from ..models import ActiveInterview, InterviewReport
+    from ..models import ActiveInterview
     from flask_login import current_user
     
     db = get_db()
@@ -138,7 +305,37 @@ def end_interview():
     if not active_session:
         return jsonify({"error": "No active session found"}), 400
 
-    history = active_session['history']
+    context, history = _interview_context(active_session)
+
+    # The job gets its own copy of the transcript, so the session can go now
+    job_id = jobs.enqueue("report", {
+        "student_id": user_id,
+        "role": active_session.get("setup", {}).get("role") or "Interview Candidate",
+        "interview": _report_source(active_session, context),
+        "history": history
+    }, owner=user_id)
+
+    # Clear DB Session
+    conversation.record_end(active_session)
+    ActiveInterview.delete_by_student(db, user_id)
+    session.pop('report_data', None)
+
+    return jsonify({"status": "queued", "job_id": job_id, "redirect_url": f"/report?job={job_id}"})
+
+def _report_source(interview, context):
+    """What the report job needs to rebuild an interview's prompt prefix; the turns go separately."""
+    if "setup" in interview:
+        return {"setup": interview["setup"], "context_key": interview.get("context_key")}
+    # Prompt stored inline, possibly as the first message of an old "history" array
+    return {"prompt": llm.context_text(context), "context_key": context.key}
+
+@jobs.register("report")
+def _run_report_job(payload, job_id):
+    from ..db import DuplicateKeyError, get_db
+    from ..models import InterviewReport
+
+    db = get_db()
+    context, _ = _interview_context(payload["interview"])
     
     # Prompt for report generation
     report_prompt = """
@@ -151,88 +348,74 @@ def end_interview():
     - suggestion (string, improvement advice)
     """
     # Create a separate history for report generation to append the instruction
-    report_history = history.copy()
+    report_history = list(payload["history"])
     report_history.append({"role": "user", "parts": [report_prompt]})
 
-    try:
-        if GOOGLE_API_KEY == "dummy-key":
-             report_data = {
-                 "score": 85,
-                 "summary": "Good technical understanding but needs more confidence.",
-                 "strengths": ["Python Knowledge", "Problem Solving"],
-                 "weaknesses": ["Communication Speed", "System Design Depth"],
-                 "suggestion": "Practice mock interviews to improve pacing."
-             }
-        else:
-            final_response = _get_gemini_response(report_history, json_mode=True)
-            report_data = final_response if isinstance(final_response, dict) else _parse_json_from_text(str(final_response))
-        
-        role = "Interview Candidate" 
+    final_response = _get_gemini_response(report_history, json_mode=True,
+                                          priority=ratelimit.HIGH, context=context)
+    report_data = final_response if isinstance(final_response, dict) else _parse_json_from_text(str(final_response))
+    # The interview is over, so its cached prefix is no longer needed
+    llm.evict_context(context.key)
 
+    try:
+        # Keyed by the job, so a retried job cannot file the report twice
         InterviewReport.create(
             db,
-            user_id,
-            role,
+            payload["student_id"],
+            payload["role"],
             report_data.get('score', 0),
             report_data.get('summary', ''),
             report_data.get('strengths', []),
             report_data.get('weaknesses', []),
-            report_data.get('suggestion', '')
+            report_data.get('suggestion', ''),
+            report_id=job_id
         )
+    except DuplicateKeyError:
+        pass
+    return {"report_id": job_id}
 
-        session['report_data'] = report_data
-        
-        # Clear DB Session
-        ActiveInterview.delete_by_student(db, user_id)
-        
-        return jsonify({"status": "success", "redirect_url": "/report"})
-    except Exception as e:
-        print(f"Report Error: {e}")
-        return jsonify({"error": str(e)}), 500
-
-def _get_gemini_response(messages, json_mode=False):
-    if GOOGLE_API_KEY == "dummy-key":
-        return {
-            "feedback": "This is a mock response (No API Key).",
-            "question": "What is your greatest strength? (Mock)"
-        }
+@interview_api_bp.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    from ..db import get_db
+    from ..models import Job
+    from flask_login import current_user
 
-    import time
-    
-    retries = 3
-    delay = 2
+    user_id = current_user.id if current_user.is_authenticated else "anonymous_session"
+    job = Job.get_by_id(get_db(), job_id)
+    if not job or job.get("owner") != user_id:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "error": job["error"],
+        "result": job["result"]
+    })
 
-    for attempt in range(retries):
+def _get_gemini_response(messages, json_mode=False, priority=ratelimit.NORMAL, context=None):
+    # Quota waits and 429 retries happen inside llm, paced by app.ratelimit
+    try:
+        content = llm.generate(messages, json_mode=json_mode, priority=priority, context=context).strip()
+        return _parse_json_from_text(content)
+    except Exception as e:
+        if ratelimit.is_quota_error(e):
+            log.warning("llm", "quota error", error=str(e))
+            raise
+        log.error("llm", "generate failed, retrying as a single prompt", error=str(e))
+        # Try a simpler fallback for stateless if chat fails (though it shouldn't)
         try:
-            model = get_gemini_model()
-            
-            chat = model.start_chat(history=messages[:-1])
-            last_message = messages[-1]['parts'][0]
-            
-            response = chat.send_message(last_message)
-            content = response.text.strip()
-            return _parse_json_from_text(content)
-        except Exception as e:
-            if "429" in str(e) or "ResourceExhausted" in str(e):
-                print(f"Gemini 429 Quota Error (Attempt {attempt+1}/{retries}): {e}")
-                if attempt < retries - 1:
-                    time.sleep(delay)
-                    delay *= 2 # Exponential backoff
-                    continue
-            
-            print(f"Gemini Error: {e}")
-            # Try a simpler fallback for stateless if chat fails (though it shouldn't)
-            try:
-                 prompt = "\n".join([f"{m['role']}: {m['parts'][0]}" for m in messages])
-                 response = model.generate_content(prompt)
-                 return _parse_json_from_text(response.text.strip())
-            except Exception as e2:
-                if attempt < retries - 1 and ("429" in str(e2) or "ResourceExhausted" in str(e2)):
-                     time.sleep(delay)
-                     delay *= 2
-                     continue
-                raise e
+            if context is not None:
+                messages = [{"role": "user", "parts": [llm.context_text(context)]}] + messages
+            prompt = "\n".join([f"{m['role']}: {m['parts'][0]}" for m in messages])
+            response = llm.generate([{"role": "user", "parts": [prompt]}], json_mode=json_mode, priority=priority)
+            return _parse_json_from_text(response.strip())
+        except Exception:
+            raise e
+
+def _stream_gemini_response(messages, context=None):
+    """Yield the model's raw reply text chunk by chunk as it is generated."""
+    return llm.stream(messages, priority=ratelimit.NORMAL, context=context)
 
+@metrics.timed("parse_model_json")
 def _parse_json_from_text(content):
     try:
         # Clean up markdown code blocks if present
@@ -247,6 +430,7 @@ def _parse_json_from_text(content):
             content = content[start:end]
         return json.loads(content)
     except Exception as e:
-        print(f"JSON Parse Error: {e}\nContent: {content}")
+        log.warning("llm", "unparseable model reply", error=str(e), content_chars=len(content))
+        log.transcript("llm", "unparseable model reply", content=content)
         # Return empty structure on failure
         return {}
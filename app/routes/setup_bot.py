@@ -1,40 +1,159 @@
 from flask import Blueprint, request, jsonify
-import openai
+from flask_login import login_required, current_user
+from collections import OrderedDict
 import json
 import os
+import re
+import threading
+import time
+from .. import llm
 
 setup_bot_bp = Blueprint('setup_bot', __name__)
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "dummy-key")
-openai.api_key = OPENAI_API_KEY
 
-@setup_bot_bp.route('/student/setup-bot', methods=['POST'])
-def setup_bot():
-    # Auth Check: Use logic or header mock
-    from flask_login import current_user
-    if current_user.is_authenticated:
-        if current_user.role != 'student':
-             return jsonify({"detail": "Forbidden"}), 403
-    else:
-        # Fallback for dev/mock testing
-        user_role = request.headers.get('X-Mock-Role', 'student')
-        if user_role != 'student':
-            return jsonify({"detail": "Forbidden"}), 403
+# Parsed requests remembered by normalized text
+SETUP_CACHE_SIZE = int(os.getenv("SETUP_CACHE_SIZE", "1024"))
+SETUP_CACHE_TTL = int(os.getenv("SETUP_CACHE_TTL", "3600"))
 
-    data = request.json
-    text = data.get("text", "")
-    
+DEFAULTS = {"job_role": "General", "interview_type": "Technical", "difficulty": "Medium"}
+
+# Keyword phrases (matched on whole words of the normalized text) for the local fast path
+ROLES = [
+    ("Full Stack Developer", ["full stack", "fullstack", "full-stack"]),
+    ("Backend Developer", ["backend", "back end", "back-end", "server side"]),
+    ("Frontend Developer", ["frontend", "front end", "front-end", "react developer", "ui developer"]),
+    ("Mobile Developer", ["mobile", "android", "ios", "flutter"]),
+    ("Machine Learning Engineer", ["machine learning", "ml engineer", "ai engineer", "deep learning"]),
+    ("Data Scientist", ["data scientist", "data science"]),
+    ("Data Analyst", ["data analyst", "data analytics", "business analyst"]),
+    ("Data Engineer", ["data engineer"]),
+    ("DevOps Engineer", ["devops", "sre", "site reliability"]),
+    ("Cloud Engineer", ["cloud engineer", "cloud architect", "aws", "azure"]),
+    ("QA Engineer", ["qa", "tester", "test engineer", "quality assurance"]),
+    ("Cybersecurity Analyst", ["security", "cybersecurity", "cyber security"]),
+    ("Product Manager", ["product manager", "product management"]),
+    ("UI/UX Designer", ["ux", "ui/ux", "ui ux", "designer"]),
+    ("Software Engineer", ["software engineer", "software developer", "sde", "swe", "programmer"]),
+]
+INTERVIEW_TYPES = [
+    ("Behavioral", ["behavioral", "behavioural", "behaviour", "behavior", "star"]),
+    ("Aptitude", ["aptitude", "reasoning", "quant", "quantitative", "logical"]),
+    ("Stress", ["stress", "pressure"]),
+    ("HR", ["hr", "human resources"]),
+    ("Custom", ["custom"]),
+    ("Technical", ["technical", "tech", "coding", "programming", "dsa", "system design"]),
+]
+DIFFICULTIES = [
+    ("Easy", ["easy", "beginner", "basic", "simple", "fresher", "entry level"]),
+    ("Hard", ["hard", "difficult", "advanced", "tough", "challenging", "expert"]),
+    ("Medium", ["medium", "intermediate", "moderate", "average"]),
+]
+
+def _normalize(text):
+    return " ".join(re.sub(r"[^a-z0-9/+#\-]+", " ", text.lower()).split())
+
+def _match(text, table):
+    """The only label whose phrases occur in ``text``; None if none or several do."""
+    found = {label for label, phrases in table
+             if any(re.search(r"(?<![\w/-])" + re.escape(p) + r"(?![\w/-])", text) for p in phrases)}
+    return found.pop() if len(found) == 1 else None
+
+def classify(text):
+    """Map a normalized request to setup fields without the LLM; None unless unambiguous.
+
+    A role and interview type must both be named; difficulty defaults to
+    Medium when not mentioned, as the model would.
+    """
+    role = _match(text, ROLES)
+    interview_type = _match(text, INTERVIEW_TYPES)
+    if role is None or interview_type is None:
+        return None
+    return {"job_role": role, "interview_type": interview_type,
+            "difficulty": _match(text, DIFFICULTIES) or DEFAULTS["difficulty"]}
+
+class TTLCache:
+    """Thread-safe LRU mapping whose entries expire ``ttl`` seconds after being stored."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (time.time() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+_cache = TTLCache(SETUP_CACHE_SIZE, SETUP_CACHE_TTL)
+_stats = {"cache_hits": 0, "cache_misses": 0, "fast_path": 0, "llm_calls": 0, "llm_errors": 0}
+_stats_lock = threading.Lock()
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+def stats():
+    with _stats_lock:
+        return dict(_stats, cache_size=len(_cache))
+
+def _ask_llm(text):
     system = """You are an assistant that maps a student's free-text request into a JSON with keys:
 - job_role (string),
 - interview_type (one of: Technical, HR, Behavioral, Stress, Aptitude, Custom),
 - difficulty (Easy, Medium, Hard).
 Return only a compact JSON object with those fields. If job role is unknown, set job_role to 'General'."""
-    
+
     prompt = [
-        {"role":"system", "content": system},
-        {"role":"user", "content": f"User request: {text}\nReturn JSON only."}
+        {"role":"user", "parts": [f"User request: {text}\nReturn JSON only."]}
     ]
-    
+
+    content = llm.generate(prompt, json_mode=True, provider="openai", model="gpt-4o", system=system).strip()
+    try:
+        return json.loads(content), True
+    except Exception:
+        # Not worth remembering; the next identical request may parse
+        return dict(DEFAULTS), False
+
+@setup_bot_bp.route('/student/setup-bot', methods=['POST'])
+@login_required
+def setup_bot():
+    if current_user.role != 'student':
+        return jsonify({"detail": "Forbidden"}), 403
+
+    data = request.json
+    text = data.get("text", "")
+    key = _normalize(text)
+
+    cached = _cache.get(key)
+    if cached is not None:
+        _count("cache_hits")
+        return jsonify(cached)
+    _count("cache_misses")
+
+    parsed = classify(key)
+    if parsed is not None:
+        _count("fast_path")
+        _cache.set(key, parsed)
+        return jsonify(parsed)
+
     try:
         # Check if dummy key, return mock response
         if OPENAI_API_KEY == "dummy-key":
@@ -45,17 +164,19 @@ Return only a compact JSON object with those fields. If job role is unknown, set
                 "mock": True
              })
 
-        resp = openai.ChatCompletion.create(
-            model="gpt-4o",
-            messages=prompt,
-            temperature=0.0,
-            max_tokens=200
-        )
-        content = resp.choices[0].message["content"].strip()
-        try:
-            parsed = json.loads(content)
-        except Exception:
-            parsed = {"job_role":"General","interview_type":"Technical","difficulty":"Medium"}
+        _count("llm_calls")
+        parsed, ok = _ask_llm(text)
+        if ok:
+            _cache.set(key, parsed)
         return jsonify(parsed)
     except Exception as e:
-        return jsonify({"job_role":"General","interview_type":"Technical","difficulty":"Medium", "error": str(e)})
+        _count("llm_errors")
+        return jsonify(dict(DEFAULTS, error=str(e)))
+
+@setup_bot_bp.route('/student/setup-bot/stats', methods=['GET'])
+@login_required
+def setup_bot_stats():
+    """Cache hit/miss and fast-path counters for this process."""
+    if current_user.role != 'hr':
+        return jsonify({"detail": "Forbidden"}), 403
+    return jsonify(stats())
@@ -1,7 +1,7 @@
 from flask import Blueprint, request, jsonify
-import os
-import io
-from pypdf import PdfReader
+from .. import log
+from ..db import get_db
+from ..resume import ResumeError, ingest
 
 student_resume_bp = Blueprint('student_resume', __name__)
 
@@ -15,23 +15,15 @@ def upload_resume():
         return jsonify({"error": "No selected file"}), 400
         
     try:
-        text = ""
-        filename = file.filename.lower()
-        
-        if filename.endswith('.pdf'):
-            # Read PDF
-            pdf_stream = io.BytesIO(file.read())
-            reader = PdfReader(pdf_stream)
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-        elif filename.endswith('.txt'):
-            # Read TXT
-            text = file.read().decode('utf-8')
-        else:
-            return jsonify({"error": "Unsupported file format. Please upload PDF or TXT."}), 400
-            
-        return jsonify({"status": "success", "text": text.strip()})
-        
+        resume = ingest(get_db(), file)
+        return jsonify({
+            "status": "success",
+            "resume_id": resume["_id"],
+            "pages": resume["pages"],
+            "truncated": resume["truncated"]
+        })
+    except ResumeError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        print(f"Resume Parse Error: {e}")
+        log.error("resume", "resume parse failed", error=str(e))
         return jsonify({"error": "Failed to parse file"}), 500
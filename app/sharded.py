@@ -0,0 +1,86 @@
+"""One-file-per-collection storage engine for the local document store.
+
+``ShardedDB`` keeps each collection in its own ``<dir>/<name>.json``, laid out
+like a one-collection ``database.json``. Every shard is a ``JsonDB`` of its
+own with its own lock and cache, created the first time its collection is
+used. A chat turn therefore rewrites only ``active_interviews.json``, and a
+login parses only ``users.json``.
+
+Split an existing ``database.json`` with ``python manage_db.py split-db``.
+"""
+import os
+import re
+import threading
+
+from .db import DB_CACHE, DB_FORMAT, DB_SHARD_DIR, INDEXES, Collection, JsonDB
+
+SHARD_SUFFIX = '.json'
+# Collection names become file names
+_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+class ShardedDB:
+    def __init__(self, directory=DB_SHARD_DIR, cache=DB_CACHE, snapshot_format=DB_FORMAT):
+        self.directory = directory
+        self.cache = cache
+        self.snapshot_format = snapshot_format
+        self.use_indexes = cache
+        # Shared with the shards, so create_index reaches whichever one holds the collection
+        self.index_specs = {name: dict(fields) for name, fields in INDEXES.items()}
+        self._shards = {}
+        self._shards_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name):
+        if not _NAME.match(name):
+            raise ValueError(f"Invalid collection name: {name!r}")
+        return os.path.join(self.directory, name + SHARD_SUFFIX)
+
+    def shard(self, name):
+        shard = self._shards.get(name)
+        if shard is None:
+            with self._shards_lock:
+                shard = self._shards.get(name)
+                if shard is None:
+                    shard = JsonDB(self.path(name), cache=self.cache, initial={name: []},
+                                   snapshot_format=self.snapshot_format)
+                    shard.index_specs = self.index_specs
+                    self._shards[name] = shard
+        return shard
+
+    def names(self):
+        return sorted(f[:-len(SHARD_SUFFIX)] for f in os.listdir(self.directory)
+                      if f.endswith(SHARD_SUFFIX) and _NAME.match(f[:-len(SHARD_SUFFIX)]))
+
+    def read(self):
+        """All collections as one dict, like ``JsonDB.read``; loads every shard."""
+        return {name: self.documents(name) for name in self.names()}
+
+    def write(self, data):
+        """Replace the collections in ``data``; shards not mentioned are left alone."""
+        for name, docs in data.items():
+            self.shard(name).write({name: docs})
+
+    def documents(self, name):
+        return self.shard(name).documents(name)
+
+    def indexes(self, name, docs):
+        return self.shard(name).indexes(name, docs)
+
+    def apply(self, op):
+        return self.shard(op['c']).apply(op)
+
+    def getattr(self, name):
+        return Collection(self, name)
+
+    # Allow attribute access like db.users
+    def __getattr__(self, name):
+        return Collection(self, name)
+
+def split(source, directory):
+    """Copy every collection of the JSON database ``source`` (and its log, if any) into its own shard."""
+    from .wal import read_database
+
+    data = read_database(source)
+    db = ShardedDB(directory, cache=False)
+    db.write(data)
+    return {name: len(docs) for name, docs in data.items()}
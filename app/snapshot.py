@@ -0,0 +1,110 @@
+"""Binary snapshot format for the local database (``DB_FORMAT=binary``).
+
+Layout, all integers little-endian uint32::
+
+    MAGIC | table length | table | records...
+
+The table is a marshalled ``{collection: (offset, length, count)}`` with
+offsets relative to the first record. A collection is ``count`` records,
+each a length followed by one marshalled document; a value that is not a
+list of documents (like the WAL's sequence marker) is stored as one bare
+record with a count of -1.
+
+The file is memory-mapped and only the table is decoded up front, so a
+process that needs one collection never decodes the others. ``marshal``
+keeps strings unescaped and loads far faster than JSON; its format can
+change between Python versions, so convert back to JSON
+(``manage_db.py convert-format json``) before upgrading Python.
+"""
+import marshal
+import mmap
+import struct
+
+MAGIC = b'IVDBSNP1'
+FORMATS = ('json', 'binary')
+
+_LEN = struct.Struct('<I')
+
+def is_binary(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def encode(data):
+    chunks, table, pos = [], {}, 0
+    for name, value in data.items():
+        start = pos
+        if isinstance(value, list):
+            for doc in value:
+                record = marshal.dumps(doc)
+                chunks += [_LEN.pack(len(record)), record]
+                pos += _LEN.size + len(record)
+            count = len(value)
+        else:
+            record = marshal.dumps(value)
+            chunks.append(record)
+            pos += len(record)
+            count = -1
+        table[name] = (start, pos - start, count)
+    table = marshal.dumps(table)
+    return b''.join([MAGIC, _LEN.pack(len(table)), table] + chunks)
+
+class Reader:
+    """Lazy view of a binary snapshot; decodes collections as they are asked for."""
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self._map[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a binary snapshot")
+            start = len(MAGIC) + _LEN.size
+            (size,) = _LEN.unpack_from(self._map, len(MAGIC))
+            self.table = marshal.loads(self._map[start:start + size])
+            self._body = start + size
+        except BaseException:
+            self.close()
+            raise
+
+    def names(self):
+        return list(self.table)
+
+    def count(self, name):
+        return self.table[name][2]
+
+    def records(self, name):
+        """Yield the documents of ``name`` one at a time."""
+        offset, length, count = self.table[name]
+        pos = self._body + offset
+        if count < 0:
+            yield marshal.loads(self._map[pos:pos + length])
+            return
+        for _ in range(count):
+            (size,) = _LEN.unpack_from(self._map, pos)
+            pos += _LEN.size
+            yield marshal.loads(self._map[pos:pos + size])
+            pos += size
+
+    def collection(self, name):
+        if self.table[name][2] < 0:
+            return next(self.records(name))
+        return list(self.records(name))
+
+    def read(self):
+        return {name: self.collection(name) for name in self.table}
+
+    def close(self):
+        # Unmap straight away: Windows cannot replace a file that is still mapped
+        if getattr(self, '_map', None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def load(path):
+    with Reader(path) as reader:
+        return reader.read()
@@ -0,0 +1,250 @@
+"""SQLite storage engine implementing the ``Collection`` API.
+
+Each collection is a table of JSON documents keyed by ``_id``. Equality,
+``$in`` and range filters on plain fields are pushed down to SQL through
+``json_extract`` and the expression indexes declared in ``app.db.INDEXES``,
+as are sorts; anything SQL cannot express is filtered in Python with the
+same matcher ``JsonDB`` uses. When the whole filter went to SQL, ``skip``
+and ``limit`` do too.
+The database runs in WAL mode, so readers never block the writer.
+"""
+import itertools
+import json
+import os
+import re
+import sqlite3
+import threading
+import uuid
+
+from . import metrics
+from .db import INDEXES, DuplicateKeyError, _is_operator, _matches, _project, _sort_spec, apply_update
+
+# Fields safe to inline into a JSON path (and so usable by expression indexes)
+_FIELD_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+def _quote(name):
+    if not _FIELD_RE.match(name):
+        raise ValueError(f"Invalid collection name: {name!r}")
+    return f'"{name}"'
+
+def _field_expr(field):
+    return f"json_extract(doc, '$.{field}')"
+
+_COMPARISONS = {'$gt': '>', '$gte': '>=', '$lt': '<', '$lte': '<='}
+
+def _scalar(value):
+    return isinstance(value, (str, int, float)) and not isinstance(value, bool)
+
+class SQLiteCollection:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+        self.table = _quote(name)
+        db.ensure_table(name)
+
+    def _where(self, query):
+        """Translate what we can of ``query`` into a WHERE clause.
+
+        Returns the clause, its parameters and whether it expresses the whole
+        query (so no row it selects will be rejected by ``_matches``).
+        """
+        clauses, params = [], []
+        exact = True
+        for k, v in (query or {}).items():
+            if k == '_id':
+                expr = "_id"
+                to_sql = str
+            elif _FIELD_RE.match(k):
+                expr = _field_expr(k)
+                to_sql = None
+            else:
+                exact = False
+                continue
+
+            if not _is_operator(v):
+                if k != '_id' and v is None:
+                    clauses.append(f"{expr} IS NULL")
+                elif k == '_id' or _scalar(v):
+                    clauses.append(f"{expr} = ?")
+                    params.append(to_sql(v) if to_sql else v)
+                else:
+                    exact = False
+                continue
+
+            for op, arg in v.items():
+                if op == '$in' and all(_scalar(a) or (to_sql and a is not None) for a in arg):
+                    clauses.append(f"{expr} IN ({', '.join('?' * len(arg))})" if arg else "0")
+                    params.extend(to_sql(a) if to_sql else a for a in arg)
+                elif op in _COMPARISONS and (to_sql or _scalar(arg)):
+                    if not to_sql:
+                        # SQL orders numbers before text; Python never compares across types
+                        kinds = "'text'" if isinstance(arg, str) else "'integer', 'real'"
+                        clauses.append(f"json_type(doc, '$.{k}') IN ({kinds})")
+                    clauses.append(f"{expr} {_COMPARISONS[op]} ?")
+                    params.append(to_sql(arg) if to_sql else arg)
+                else:
+                    exact = False
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        return where, params, exact
+
+    def _select(self, conn, query, columns="doc", sort=None, skip=0, limit=None):
+        where, params, exact = self._where(query)
+        order = [("_id" if field == '_id' else _field_expr(field)) + (" DESC" if direction < 0 else "")
+                 for field, direction in _sort_spec(sort) if field == '_id' or _FIELD_RE.match(field)]
+        sql = f"SELECT {columns} FROM {self.table}{where} ORDER BY {', '.join(order + ['rowid'])}"
+        if exact and (skip or limit):
+            sql += " LIMIT ? OFFSET ?"
+            params = params + [limit if limit else -1, skip]
+            skip, limit = 0, None
+
+        def rows():
+            for row in conn.execute(sql, params):
+                metrics.record_bytes("read", len(row[-1]))
+                doc = json.loads(row[-1])
+                # SQL narrowed the rows; the Python matcher has the final say
+                if exact or _matches(doc, query):
+                    yield row, doc
+        stop = None if limit is None else skip + limit
+        return itertools.islice(rows(), skip, stop)
+
+    @metrics.db_operation("find_one")
+    def find_one(self, query, projection=None):
+        for _, doc in self._select(self.db.conn(), query, limit=1):
+            return _project(doc, projection, clone=False)
+        return None
+
+    @metrics.db_operation("find")
+    def find(self, query=None, projection=None, sort=None, skip=0, limit=None):
+        rows = self._select(self.db.conn(), query, sort=sort, skip=skip, limit=limit or None)
+        return [_project(doc, projection, clone=False) for _, doc in rows]
+
+    @metrics.db_operation("insert_one")
+    def insert_one(self, doc):
+        if '_id' not in doc:
+            doc['_id'] = str(uuid.uuid4())
+
+        try:
+            with self.db.transaction() as conn:
+                text = json.dumps(doc)
+                conn.execute(f"INSERT INTO {self.table} (_id, doc) VALUES (?, ?)", (str(doc['_id']), text))
+            metrics.record_bytes("written", len(text))
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKeyError(str(e)) from e
+
+        # Mimic PyMongo InsertResult
+        class InsertResult:
+            inserted_id = doc['_id']
+        return InsertResult()
+
+    @metrics.db_operation("update_one")
+    def update_one(self, query, update):
+        try:
+            with self.db.transaction() as conn:
+                # Fetch the one row up front so its cursor is done before the UPDATE
+                matches = list(self._select(conn, query, columns="rowid, doc", limit=1))
+                if not matches:
+                    return False
+                row, doc = matches[0]
+                apply_update(doc, update)
+                text = json.dumps(doc)
+                conn.execute(f"UPDATE {self.table} SET _id = ?, doc = ? WHERE rowid = ?",
+                             (str(doc.get('_id')), text, row[0]))
+            metrics.record_bytes("written", len(text))
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKeyError(str(e)) from e
+        return True
+
+    @metrics.db_operation("delete_many")
+    def delete_many(self, query):
+        with self.db.transaction() as conn:
+            rowids = [(row[0],) for row, _ in self._select(conn, query, columns="rowid, doc")]
+            conn.executemany(f"DELETE FROM {self.table} WHERE rowid = ?", rowids)
+        return len(rowids)
+
+    def create_index(self, field, unique=False):
+        self.db.create_index(self.name, field, unique)
+        return field
+
+class SQLiteDB:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._tables = set()
+        self._tables_lock = threading.Lock()
+        conn = self.conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+
+    def conn(self):
+        # sqlite3 connections are not shareable across threads, so keep one per
+        # thread, nor across a fork (e.g. opened by APP_PRELOAD in a preforking
+        # server's master), so a child opens its own
+        pid, conn = getattr(self._local, 'conn', (None, None))
+        if conn is None or pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = (os.getpid(), conn)
+        return conn
+
+    def transaction(self):
+        return _Transaction(self.conn())
+
+    def ensure_table(self, name):
+        if name in self._tables:
+            return
+        with self._tables_lock:
+            if name in self._tables:
+                return
+            conn = self.conn()
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {_quote(name)} (_id TEXT PRIMARY KEY, doc TEXT NOT NULL)")
+            for field, unique in INDEXES.get(name, {}).items():
+                if field != '_id':
+                    self.create_index(name, field, unique)
+            self._tables.add(name)
+
+    def create_index(self, name, field, unique=False):
+        if not _FIELD_RE.match(field):
+            raise ValueError(f"Invalid field name: {field!r}")
+        self.conn().execute(
+            f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {_quote(name + '_' + field)} "
+            f"ON {_quote(name)} ({_field_expr(field)})"
+        )
+
+    def import_data(self, data):
+        """Bulk-load a ``database.json``-style dict; existing ``_id``s are kept as they are."""
+        counts = {}
+        for name, docs in data.items():
+            if not isinstance(docs, list) or not _FIELD_RE.match(name):
+                continue
+            self.ensure_table(name)
+            rows = []
+            for doc in docs:
+                doc.setdefault('_id', str(uuid.uuid4()))
+                rows.append((str(doc['_id']), json.dumps(doc)))
+            with self.transaction() as conn:
+                before = conn.total_changes
+                conn.executemany(f"INSERT OR IGNORE INTO {_quote(name)} (_id, doc) VALUES (?, ?)", rows)
+                counts[name] = conn.total_changes - before
+        return counts
+
+    def getattr(self, name):
+        return SQLiteCollection(self, name)
+
+    # Allow attribute access like db.users
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return SQLiteCollection(self, name)
+
+class _Transaction:
+    """``BEGIN IMMEDIATE`` ... ``COMMIT``, so read-modify-write steps see no interleaved writer."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
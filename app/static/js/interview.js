@@ -137,6 +137,49 @@ class SpeechManager {
 
         this.synthesis.speak(utterThis);
     }
+
+    /**
+     * Queue text behind whatever is already being spoken (used while a reply streams in).
+     * onVoiceStart fires for the first queued piece, onVoiceEnd once the queue drains
+     * after finishQueue() has been called.
+     */
+    enqueue(text) {
+        if (!this._queued) {
+            this._queued = 0;
+        }
+        if (this._queued === 0 && this.synthesis.speaking) this.synthesis.cancel();
+        this._queueClosed = false;
+
+        const utterThis = new SpeechSynthesisUtterance(text);
+        const done = () => {
+            this._queued--;
+            if (this._queued === 0 && this._queueClosed && this.onVoiceEnd) this.onVoiceEnd();
+        };
+        utterThis.onstart = () => {
+            if (!this._queueStarted) {
+                this._queueStarted = true;
+                if (this.onVoiceStart) this.onVoiceStart();
+            }
+        };
+        utterThis.onend = done;
+        utterThis.onerror = (e) => {
+            console.error("Speech synthesis error", e);
+            done();
+        };
+
+        const voices = this.synthesis.getVoices();
+        const preferredVoice = voices.find(v => v.name.includes("Google US English") || v.name.includes("Samantha"));
+        if (preferredVoice) utterThis.voice = preferredVoice;
+
+        this._queued++;
+        this.synthesis.speak(utterThis);
+    }
+
+    finishQueue() {
+        this._queueClosed = true;
+        this._queueStarted = false;
+        if (!this._queued && this.onVoiceEnd) this.onVoiceEnd();
+    }
 }
 
 class InterviewController {
@@ -162,7 +205,7 @@ class InterviewController {
         this.apiState = {
             role: config.role || new URLSearchParams(window.location.search).get('role') || 'Software Engineer',
             type: config.type || new URLSearchParams(window.location.search).get('type') || 'Technical',
-            resumeText: config.resumeText || "No resume provided.",
+            resumeId: config.resumeId || null,
             conversationActive: false
         };
 
@@ -215,7 +258,7 @@ class InterviewController {
                     role: this.apiState.role,
                     type: this.apiState.type,
                     difficulty: 'Medium',
-                    resume_text: this.apiState.resumeText
+                    resume_id: this.apiState.resumeId
                 })
             });
             const data = await res.json();
@@ -303,7 +346,27 @@ class InterviewController {
         console.log("User Answer:", text);
         this.setStage('processing');
 
-        // Send to API
+        // Stream the reply so speech can start on its first sentence
+        try {
+            const res = await fetch('/api/interview/chat/stream', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ answer: text })
+            });
+            if (res.ok && res.body) {
+                await this.playStreamedResponse(res.body.getReader());
+                return;
+            }
+            if (res.status !== 404) {
+                this.playAiResponse(await res.json());
+                return;
+            }
+        } catch (e) {
+            console.error("Streaming API Error", e);
+            return;
+        }
+
+        // Server without the streaming endpoint
         try {
             const res = await fetch('/api/interview/chat', {
                 method: 'POST',
@@ -317,6 +380,80 @@ class InterviewController {
         }
     }
 
+    async playStreamedResponse(reader) {
+        const decoder = new TextDecoder();
+        const text = { feedback: '', question: '' };
+        const spoken = { feedback: 0, question: 0 };
+        let buffer = '';
+        let speaking = false;
+
+        // Speak every complete sentence we have not spoken yet
+        const speakSentences = (field, flush) => {
+            const pending = text[field].slice(spoken[field]);
+            const match = flush ? pending : (pending.match(/^[\s\S]*[.?!](\s|$)/) || [''])[0];
+            if (!match.trim()) return;
+            spoken[field] += match.length;
+            if (!speaking) {
+                speaking = true;
+                this.setStage('speaking');
+            }
+            this.speechManager.enqueue(match.trim());
+        };
+
+        const handleEvent = (raw) => {
+            let event = 'message';
+            let data = '';
+            for (const line of raw.split('\n')) {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            }
+            if (!data) return;
+            const payload = JSON.parse(data);
+
+            if (event === 'delta') {
+                text[payload.field] += payload.text;
+                if (payload.field === 'question') this.updateAiCaption(text.question);
+                // Feedback is read before the question, so hold the question until feedback is complete
+                if (payload.field === 'feedback') speakSentences('feedback', false);
+                else {
+                    speakSentences('feedback', true);
+                    speakSentences('question', false);
+                }
+            } else if (event === 'done') {
+                if (!speaking) {
+                    this.playAiResponse(payload);
+                    return;
+                }
+                if (payload.question && payload.question !== text.question) {
+                    // The saved reply differs from what streamed (fallback or conflict); say that instead
+                    this.speechManager.synthesis.cancel();
+                    this.playAiResponse(payload);
+                    return;
+                }
+                speakSentences('feedback', true);
+                speakSentences('question', true);
+                this.updateAiCaption(payload.question);
+                this.speechManager.finishQueue();
+                setTimeout(() => {
+                    if (!this.speechManager.synthesis.speaking && !this.speechManager.isListening) {
+                        this.setAvatarState('listening');
+                    }
+                }, 1200);
+            }
+        };
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                handleEvent(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+            }
+        }
+    }
+
     setStage(stage) {
         this.setAvatarState(stage);
     }
@@ -333,7 +470,8 @@ class InterviewController {
                 const res = await fetch('/api/interview/end', { method: 'POST' });
                 const data = await res.json();
 
-                if (data.status === 'success') {
+                // The report is generated in the background; the report page waits for it
+                if (data.status === 'queued' || data.status === 'success') {
                     window.location.href = data.redirect_url;
                 } else {
                     alert("Error generating report: " + (data.error || "Unknown"));
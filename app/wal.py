@@ -0,0 +1,245 @@
+"""Append-only log storage engine for the local document store.
+
+``LogDB`` keeps the whole database in memory and appends every mutation to
+``<database>.wal`` as one JSON line, so a write costs the size of the change
+instead of re-serializing every collection. Once the log grows past the size
+of the snapshot it is folded back into ``database.json`` by a background
+thread. The snapshot is written in ``DB_FORMAT`` like ``JsonDB``'s, so
+``JsonDB`` can still open it.
+
+Several processes can share one database: appends happen under the
+database's exclusive file lock, and each process replays records written by
+the others before it reads or writes.
+"""
+import json
+import os
+import threading
+
+from . import log, metrics
+from .db import DB_FILE, FileLock, JsonDB, apply_op, changed
+
+WAL_SUFFIX = '.wal'
+# Log segment being folded into the snapshot by a running (or interrupted) compaction
+OLD_SUFFIX = '.old'
+# Snapshot key recording the last log sequence number it contains
+META_KEY = '_wal'
+# Never compact a log smaller than this, however small the snapshot is
+MIN_COMPACT_BYTES = 1 << 20
+
+class LogDB(JsonDB):
+    def __init__(self, filepath=DB_FILE, fsync=False, min_compact_bytes=MIN_COMPACT_BYTES):
+        super().__init__(filepath, cache=False)
+        self.use_indexes = True
+        self.log_path = filepath + WAL_SUFFIX
+        self.fsync = fsync
+        self.min_compact_bytes = min_compact_bytes
+        # Guards the in-memory state; always taken inside self.lock, never around it
+        self._lock = threading.RLock()
+        # Serializes compactions across threads and processes
+        self._compact_lock = threading.Lock()
+        self._compact_file_lock = FileLock(filepath + '.compact.lock')
+        self._compacting = False
+        self._log = None
+
+        with self.lock.acquire(), self._lock:
+            self._load(truncate_torn=True)
+        # A leftover segment means a compaction was interrupted; finish it now
+        if os.path.exists(self.log_path + OLD_SUFFIX):
+            self.compact()
+
+    def _load(self, truncate_torn=False):
+        if self._log is not None:
+            self._log.close()
+
+        state = self._parse()[0]
+        self._seq = state.pop(META_KEY, {}).get('seq', 0)
+        self._snapshot_bytes = os.path.getsize(self.filepath)
+
+        self._replay(self.log_path + OLD_SUFFIX, state)
+        end = self._replay(self.log_path, state)
+        if truncate_torn and os.path.exists(self.log_path) and end < os.path.getsize(self.log_path):
+            # Only safe under the exclusive lock: otherwise the tail may be an append in progress
+            with open(self.log_path, 'r+b') as f:
+                f.truncate(end)
+        self._state = state
+
+        self._log = open(self.log_path, 'ab')
+        self._log_ino = os.fstat(self._log.fileno()).st_ino
+        self._log_pos = end
+
+    def _encode(self, data):
+        # Compactions rewrite the snapshot often; skip the indentation
+        if self.snapshot_format == 'json':
+            return json.dumps(data).encode('utf-8')
+        return super()._encode(data)
+
+    def _replay(self, path, state, start=0, indexed=False):
+        """Apply the records in ``path`` from byte ``start``; return where they end."""
+        if not os.path.exists(path):
+            return start
+
+        end = start
+        with open(path, 'rb') as f:
+            f.seek(start)
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError("incomplete record")
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn tail from a crash mid-append; everything before it is valid
+                    break
+                end += len(line)
+                metrics.record_bytes("read", len(line))
+                if record['seq'] > self._seq:
+                    indexes = self.indexes(record['c'], state.setdefault(record['c'], [])) if indexed else None
+                    apply_op(state, record, indexes)
+                    self._seq = record['seq']
+        return end
+
+    def _sync(self):
+        """Pick up records other processes appended since we last looked."""
+        try:
+            st = os.stat(self.log_path)
+            if st.st_ino == self._log_ino and st.st_size == self._log_pos:
+                return
+        except FileNotFoundError:
+            pass
+
+        with self.lock.acquire(exclusive=False), self._lock:
+            try:
+                rotated = os.stat(self.log_path).st_ino != self._log_ino
+            except FileNotFoundError:
+                rotated = True
+            if rotated:
+                # Another process compacted; start over from its snapshot
+                self._load()
+            else:
+                self._log_pos = self._replay(self.log_path, self._state, self._log_pos, indexed=True)
+
+    def read(self):
+        self._sync()
+        with self._lock:
+            return json.loads(json.dumps(self._state))
+
+    def write(self, data):
+        self._compact(data=data)
+
+    def documents(self, name):
+        self._sync()
+        return self._state.get(name, [])
+
+    def apply(self, op):
+        with self.lock.acquire(), self._lock:
+            self._sync()
+            docs = self._state.setdefault(op['c'], [])
+            result = apply_op(self._state, op, self.indexes(op['c'], docs))
+            if not changed(op, result):
+                return result
+
+            record = dict(op, seq=self._seq + 1)
+            line = (json.dumps(record) + '\n').encode('utf-8')
+            try:
+                if os.fstat(self._log.fileno()).st_size > self._log_pos:
+                    # A writer crashed mid-append; cut its partial record off, or
+                    # every reader would stop there and never see ours
+                    self._log.truncate(self._log_pos)
+                self._log.write(line)
+                self._log.flush()
+                metrics.record_bytes("written", len(line))
+                if self.fsync:
+                    os.fsync(self._log.fileno())
+            except OSError:
+                # The change never reached the log, so drop it from memory too
+                # (and any part of it that did, while we still hold the lock)
+                self._load(truncate_torn=True)
+                raise
+            self._seq += 1
+            self._log_pos += len(line)
+
+            if not self._compacting and self._due():
+                self._compacting = True
+                threading.Thread(target=self._background_compact, daemon=True).start()
+        return result
+
+    def _due(self):
+        return self._log_pos > max(self.min_compact_bytes, self._snapshot_bytes)
+
+    def compact(self):
+        """Fold the log into the snapshot synchronously."""
+        self._compact()
+
+    def _background_compact(self):
+        try:
+            self._compact(only_if_due=True)
+        except Exception as e:
+            log.error("db", "WAL compaction failed", error=str(e))
+        finally:
+            self._compacting = False
+
+    def _compact(self, data=None, only_if_due=False):
+        old_path = self.log_path + OLD_SUFFIX
+        tmp_path = self.filepath + '.tmp'
+
+        with self._compact_lock, self._compact_file_lock.acquire():
+            with self.lock.acquire(), self._lock:
+                self._sync()
+                if only_if_due and not self._due():
+                    # Another process compacted while we waited
+                    return
+                if data is not None:
+                    self._state = json.loads(json.dumps(data))
+                    self._seq += 1
+                payload = dict(self._state)
+                payload[META_KEY] = {'seq': self._seq}
+                blob = self._encode(payload)
+
+                # Move the log aside; new records go to a fresh one meanwhile
+                self._log.close()
+                if os.path.exists(old_path):
+                    with open(old_path, 'ab') as old, open(self.log_path, 'rb') as live:
+                        old.write(live.read())
+                    os.remove(self.log_path)
+                else:
+                    os.replace(self.log_path, old_path)
+                self._log = open(self.log_path, 'ab')
+                self._log_ino = os.fstat(self._log.fileno()).st_ino
+                self._log_pos = 0
+
+                if data is not None:
+                    # A full replace is not in the log, so publish it before anyone reloads
+                    self._publish(blob, tmp_path, old_path)
+                    return
+
+            self._publish(blob, tmp_path, old_path)
+
+    def _publish(self, blob, tmp_path, old_path):
+        metrics.record_bytes("written", len(blob))
+        with open(tmp_path, 'wb') as f:
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        with self.lock.acquire():
+            os.replace(tmp_path, self.filepath)
+            os.remove(old_path)
+        self._snapshot_bytes = len(blob)
+
+    def close(self):
+        with self._lock:
+            self._log.close()
+
+def read_database(filepath=DB_FILE):
+    """Every collection of the database at ``filepath``, including records still only in its log.
+
+    For offline tools: reading the snapshot alone would miss whatever has not
+    been compacted yet.
+    """
+    if os.path.exists(filepath + WAL_SUFFIX) or os.path.exists(filepath + WAL_SUFFIX + OLD_SUFFIX):
+        db = LogDB(filepath)
+        try:
+            return db.read()
+        finally:
+            db.close()
+    data = JsonDB(filepath, cache=False).read()
+    data.pop(META_KEY, None)
+    return data
@@ -0,0 +1,45 @@
+"""Optional eager loading at startup (APP_PRELOAD=1).
+
+By default the LLM SDKs, the PDF parser and the database contents are
+loaded by the first request that needs them, which keeps imports (tests,
+scripts, a worker that only serves logins) fast but makes those first
+requests slow. In production set APP_PRELOAD=1 to pay that cost at startup
+instead. With ``gunicorn --preload`` it is paid once in the master and the
+loaded modules are shared with the forked workers.
+
+The resume parser pool is not started here: forking it before gunicorn
+forks its workers would leave the workers without one.
+"""
+import os
+import time
+from . import log
+
+APP_PRELOAD = os.getenv("APP_PRELOAD", "0") == "1"
+
+def preload():
+    from . import llm
+    from .db import get_db
+
+    started = time.perf_counter()
+    loaded = []
+    for name in dict.fromkeys([llm.LLM_PROVIDER] + (["openai"] if llm.OPENAI_API_KEY != "dummy-key" else [])):
+        try:
+            llm.get_provider(name)
+            loaded.append(name)
+        except Exception as e:
+            log.warning("startup", "LLM provider preload failed", provider=name, error=str(e))
+
+    try:
+        # Imported here, the resume parser processes inherit it when forked
+        import pypdf  # noqa: F401
+        loaded.append("pypdf")
+    except ImportError as e:
+        log.warning("startup", "pypdf preload failed", error=str(e))
+
+    db = get_db()
+    for name in ("users", "job_roles", "questions", "active_interviews"):
+        # Parses (or decodes) the collection and builds its indexes
+        getattr(db, name).find_one({})
+    loaded.append("database")
+
+    log.event("startup", "preloaded", loaded=loaded, seconds=round(time.perf_counter() - started, 3))
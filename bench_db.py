@@ -0,0 +1,94 @@
+import sys
+import os
+import json
+import tempfile
+import time
+
+# Add the project root to sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.db import JsonDB
+from app.snapshot import FORMATS
+
+SIZES = [100, 1000, 10000]
+LOOKUPS = 200
+
+def build_db(path, n, snapshot_format='json'):
+    # Users plus one report and one interview transcript each, roughly the shape the app produces
+    data = {"users": [], "job_roles": [], "reports": [], "active_interviews": []}
+    for i in range(n):
+        data["users"].append({
+            "_id": f"user-{i}",
+            "name": f"Student {i}",
+            "email": f"student{i}@example.com",
+            "password": "pbkdf2:sha256:600000$" + "x" * 80,
+            "role": "student"
+        })
+        data["reports"].append({
+            "_id": f"report-{i}",
+            "student_id": f"user-{i}",
+            "role": "Interview Candidate",
+            "score": i % 100,
+            "summary": "Good technical understanding but needs more confidence.",
+            "strengths": ["Python Knowledge", "Problem Solving"],
+            "weaknesses": ["Communication Speed", "System Design Depth"],
+            "suggestion": "Practice mock interviews to improve pacing.",
+            "date": "Today"
+        })
+        # Transcripts hold each model reply as a JSON string, which JSON then escapes again
+        reply = json.dumps({"feedback": "Good answer, but consider edge cases.", "question": "How would you scale it?"})
+        data["active_interviews"].append({
+            "_id": f"interview-{i}",
+            "student_id": f"user-{i}",
+            "turns": [{"role": "user", "parts": ["My answer " * 20]}, {"role": "model", "parts": [reply]}] * 10
+        })
+    JsonDB(path, cache=False, snapshot_format=snapshot_format).write(data)
+
+def time_lookups(db, n):
+    # Parse the file (when caching) before timing, so only lookups are measured
+    db.users.find_one({"_id": "user-0"})
+    start = time.perf_counter()
+    for i in range(LOOKUPS):
+        db.users.find_one({"_id": f"user-{(i * 7919) % n}"})
+    return (time.perf_counter() - start) / LOOKUPS * 1000
+
+def run_benchmark():
+    print(f"{'users':>8} {'file KB':>9} {'uncached ms':>12} {'cached ms':>10} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in SIZES:
+            path = os.path.join(tmp, f"db_{n}.json")
+            build_db(path, n)
+            uncached = time_lookups(JsonDB(path, cache=False), n)
+            cached = time_lookups(JsonDB(path, cache=True), n)
+            size_kb = os.path.getsize(path) / 1024
+            print(f"{n:>8} {size_kb:>9.0f} {uncached:>12.3f} {cached:>10.3f} {uncached / cached:>7.1f}x")
+
+def time_call(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def run_format_benchmark():
+    # Cold loads: every call opens the file afresh, as a new worker process would
+    print(f"{'users':>8} {'format':>7} {'file KB':>9} {'full load ms':>13} {'users only ms':>14} {'write ms':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in SIZES:
+            for snapshot_format in FORMATS:
+                path = os.path.join(tmp, f"db_{n}.{snapshot_format}")
+                build_db(path, n, snapshot_format)
+                db = JsonDB(path, cache=False, snapshot_format=snapshot_format)
+                data = db.read()
+                full = time_call(lambda: JsonDB(path, cache=False).read())
+                users = time_call(lambda: JsonDB(path, cache=True).documents("users"))
+                write = time_call(lambda: db.write(data))
+                size_kb = os.path.getsize(path) / 1024
+                print(f"{n:>8} {snapshot_format:>7} {size_kb:>9.0f} {full:>13.1f} {users:>14.1f} {write:>9.1f}")
+
+if __name__ == "__main__":
+    run_benchmark()
+    print()
+    run_format_benchmark()
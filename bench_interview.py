@@ -0,0 +1,230 @@
+"""Load test for the interview flow, fully offline.
+
+Boots the app in-process against a fresh temporary database with the fake
+LLM provider, runs N candidates through register -> start -> chat turns ->
+end -> report concurrently, and reports latency percentiles per endpoint,
+requests per second and how much the database grew. Results are written as
+JSON (including the git commit) so runs can be compared across commits:
+
+    python bench_interview.py --candidates 50 --turns 8 --output before.json
+    python bench_interview.py --candidates 50 --turns 8 --compare before.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(ROOT)
+
+PERCENTILES = (50, 95, 99)
+# How long to wait for a report job before counting it as failed
+REPORT_TIMEOUT = 120.0
+
+def percentile(sorted_values, p):
+    # Nearest rank
+    if not sorted_values:
+        return None
+    rank = max(int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+def db_bytes(directory):
+    total = 0
+    for base, _, files in os.walk(directory):
+        for name in files:
+            if not name.endswith('.lock'):
+                total += os.path.getsize(os.path.join(base, name))
+    return total
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def configure(args, workdir):
+    """Point the app at a throwaway database and the fake LLM; must run before importing it."""
+    os.chdir(workdir)
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["JOB_WORKERS"] = str(args.job_workers)
+    os.environ["DB_FORMAT"] = args.format
+    if args.engine == "sqlite":
+        os.environ["MONGO_URI"] = "sqlite:///" + os.path.join(workdir, "database.db")
+    else:
+        os.environ.pop("MONGO_URI", None)
+        os.environ["DB_ENGINE"] = args.engine
+    if args.rpm:
+        os.environ["LLM_RATE_LIMITS"] = f"fake={args.rpm}/0"
+    if not args.verbose:
+        # Logging still runs, so its cost is measured; only the output goes aside
+        os.environ["LOG_FILE"] = os.path.join(workdir, "app.log")
+
+class Recorder:
+    def __init__(self):
+        self.timings = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def call(self, name, fn, *args, **kwargs):
+        start = time.perf_counter()
+        response = fn(*args, **kwargs)
+        # Streams only finish once the body is read
+        response.get_data()
+        elapsed = (time.perf_counter() - start) * 1000
+        self.add(name, elapsed, ok=response.status_code < 400)
+        return response
+
+    def add(self, name, elapsed_ms, ok=True):
+        with self._lock:
+            self.timings.setdefault(name, []).append(elapsed_ms)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self):
+        result = {}
+        for name, values in sorted(self.timings.items()):
+            values = sorted(values)
+            stats = {"count": len(values), "errors": self.errors.get(name, 0),
+                     "mean_ms": round(sum(values) / len(values), 2), "max_ms": round(values[-1], 2)}
+            for p in PERCENTILES:
+                stats[f"p{p}_ms"] = round(percentile(values, p), 2)
+            result[name] = stats
+        return result
+
+def run_candidate(app, recorder, index, args, outcomes):
+    client = app.test_client()
+    email = f"candidate{index}@bench.local"
+    recorder.call("register", client.post, "/register", data={"name": f"Candidate {index}", "email": email, "password": "pw"})
+    recorder.call("login", client.post, "/login", data={"email": email, "password": "pw"})
+
+    r = recorder.call("start", client.post, "/api/interview/start", json={
+        "role": "Software Engineer", "type": "Technical", "difficulty": "Medium",
+        "resume_text": f"Candidate {index}: five years of Python, Flask and PostgreSQL."
+    })
+    if r.status_code != 200:
+        outcomes.append("start_failed")
+        return
+
+    for turn in range(args.turns):
+        answer = f"Answer {turn} from candidate {index}: " + "I would profile it first, then fix the hot path. " * 4
+        if args.stream and turn % 2:
+            recorder.call("chat_stream", client.post, "/api/interview/chat/stream", json={"answer": answer})
+        else:
+            recorder.call("chat", client.post, "/api/interview/chat", json={"answer": answer})
+
+    ended = time.perf_counter()
+    r = recorder.call("end", client.post, "/api/interview/end")
+    job_id = (r.get_json() or {}).get("job_id")
+    if not job_id:
+        outcomes.append("end_failed")
+        return
+
+    status = None
+    while time.perf_counter() - ended < REPORT_TIMEOUT:
+        status = recorder.call("job_poll", client.get, f"/api/jobs/{job_id}").get_json().get("status")
+        if status in ("done", "failed"):
+            break
+        time.sleep(args.poll_interval)
+    recorder.add("report_ready", (time.perf_counter() - ended) * 1000, ok=status == "done")
+    outcomes.append("completed" if status == "done" else "report_" + str(status))
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="bench-interview-")
+    configure(args, workdir)
+
+    from app.app import app
+    from app import llm
+
+    provider = llm.FakeProvider(latency=args.latency, error_rate=args.error_rate, seed=args.seed)
+    llm.set_provider(provider)
+    app.config["TESTING"] = True
+
+    bytes_before = db_bytes(workdir)
+    recorder = Recorder()
+    outcomes = []
+    threads = [threading.Thread(target=run_candidate, args=(app, recorder, i, args, outcomes))
+               for i in range(args.candidates)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    bytes_after = db_bytes(workdir)
+
+    endpoints = recorder.summary()
+    requests = sum(s["count"] for name, s in endpoints.items() if name != "report_ready")
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "verbose")},
+        "wall_seconds": round(wall, 3),
+        "requests": requests,
+        "requests_per_second": round(requests / wall, 2),
+        "interviews_completed": outcomes.count("completed"),
+        "outcomes": {o: outcomes.count(o) for o in sorted(set(outcomes))},
+        "llm_calls": provider.calls,
+        "endpoints": endpoints,
+        "db": {
+            "engine": args.engine,
+            "format": args.format,
+            "bytes_before": bytes_before,
+            "bytes_after": bytes_after,
+            "growth_bytes": bytes_after - bytes_before,
+            "growth_per_interview": round((bytes_after - bytes_before) / max(args.candidates, 1)),
+        },
+    }
+
+def print_results(results, baseline=None):
+    print(f"commit {results['commit']}  {results['interviews_completed']}/{results['config']['candidates']} interviews, "
+          f"{results['requests']} requests in {results['wall_seconds']} s = {results['requests_per_second']} req/s")
+    print(f"{'endpoint':>14} {'count':>6} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}" + (f" {'p95 vs base':>12}" if baseline else ""))
+    for name, s in results["endpoints"].items():
+        line = f"{name:>14} {s['count']:>6} {s['errors']:>4} {s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['p99_ms']:>9.1f}"
+        base = (baseline or {}).get("endpoints", {}).get(name)
+        if base and base["p95_ms"]:
+            line += f" {s['p95_ms'] / base['p95_ms']:>11.2f}x"
+        print(line)
+    db = results["db"]
+    print(f"db ({db['engine']}/{db['format']}): {db['bytes_before']} -> {db['bytes_after']} bytes, "
+          f"{db['growth_per_interview']} bytes per interview")
+    if baseline:
+        print(f"req/s vs base ({baseline.get('commit')}): {results['requests_per_second'] / baseline['requests_per_second']:.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of the interview flow.")
+    parser.add_argument("--candidates", type=int, default=20, help="Concurrent candidates (default: %(default)s)")
+    parser.add_argument("--turns", type=int, default=5, help="Chat turns per interview (default: %(default)s)")
+    parser.add_argument("--stream", action="store_true", help="Send every other turn through the streaming endpoint")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake LLM seconds per call (default: %(default)s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of LLM calls answered with a 429 (default: %(default)s)")
+    parser.add_argument("--rpm", type=int, default=0, help="Rate-limit the fake model to this many requests per minute")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the fake LLM's 429s (default: %(default)s)")
+    parser.add_argument("--engine", choices=("json", "wal", "sharded", "sqlite"), default="json", help="Database engine (default: %(default)s)")
+    parser.add_argument("--format", choices=("json", "binary"), default="json", help="Snapshot format (default: %(default)s)")
+    parser.add_argument("--job-workers", type=int, default=2, help="Report worker threads (default: %(default)s)")
+    parser.add_argument("--poll-interval", type=float, default=0.1, help="Seconds between report status polls (default: %(default)s)")
+    parser.add_argument("--output", default="bench_interview.json", help="Where to write the JSON results (default: %(default)s)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--verbose", action="store_true", help="Show the app's own output during the run")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results = run(args)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print_results(results, baseline)
+    print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Cold-start benchmark: how long a fresh interpreter takes to import the app.
+
+Each run starts a new ``python -X importtime`` process importing ``app.app``
+from an empty directory, so nothing is cached in memory. Reports the median
+wall time, the app's own import time, the slowest modules and whether any
+heavy SDK got imported eagerly, and writes the results as JSON (with the git
+commit) for comparison across commits:
+
+    python bench_startup.py --output before.json
+    python bench_startup.py --compare before.json
+    python bench_startup.py --preload        # with APP_PRELOAD=1
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Modules that should only load on the first request that needs them
+HEAVY_MODULES = ["google.generativeai", "openai", "pypdf", "grpc", "multiprocessing", "sqlite3", "cProfile"]
+TOP_MODULES = 15
+
+PROBE = ("import sys, json; import app.app; "
+         "print(json.dumps([m for m in %r if m in sys.modules]))" % HEAVY_MODULES)
+
+def parse_importtime(stderr):
+    """{module: (self us, cumulative us)} from ``-X importtime`` output."""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        modules[name] = (int(own), int(cumulative))
+    return modules
+
+def run_once(preload):
+    env = dict(os.environ, PYTHONPATH=ROOT, APP_PRELOAD="1" if preload else "0", JOB_WORKERS="0")
+    with tempfile.TemporaryDirectory() as workdir:
+        started = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE], cwd=workdir, env=env,
+                              capture_output=True, text=True)
+        wall = (time.perf_counter() - started) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+    heavy = json.loads(proc.stdout.strip().splitlines()[-1])
+    return wall, parse_importtime(proc.stderr), heavy
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    walls, app_imports, runs = [], [], []
+    for _ in range(args.runs):
+        wall, modules, heavy = run_once(args.preload)
+        walls.append(wall)
+        app_imports.append(modules.get("app.app", (0, 0))[1] / 1000)
+        runs.append(modules)
+
+    # Slowest modules by cumulative time in the median run
+    median_run = runs[walls.index(sorted(walls)[len(walls) // 2])]
+    top = sorted(median_run.items(), key=lambda item: item[1][1], reverse=True)[:TOP_MODULES]
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "preload": args.preload,
+        "runs": args.runs,
+        "wall_ms": {"median": round(statistics.median(walls), 1), "min": round(min(walls), 1), "max": round(max(walls), 1)},
+        "app_import_ms": round(statistics.median(app_imports), 1),
+        "heavy_modules_loaded": heavy,
+        "top_modules": [{"module": name, "self_ms": own / 1000, "cumulative_ms": cumulative / 1000}
+                        for name, (own, cumulative) in top],
+    }
+
+def print_results(results, baseline=None):
+    wall = results["wall_ms"]
+    print(f"commit {results['commit']}  python {results['python']}  preload={results['preload']}  {results['runs']} runs")
+    print(f"process start + import: median {wall['median']} ms (min {wall['min']}, max {wall['max']})")
+    print(f"import app.app: {results['app_import_ms']} ms")
+    print(f"heavy modules imported: {', '.join(results['heavy_modules_loaded']) or 'none'}")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for m in results["top_modules"]:
+        print(f"{m['cumulative_ms']:>14.1f} {m['self_ms']:>9.1f}  {m['module']}")
+    if baseline:
+        print(f"median vs base ({baseline.get('commit')}): {wall['median'] / baseline['wall_ms']['median']:.2f}x, "
+              f"app import {results['app_import_ms'] / max(baseline['app_import_ms'], 0.001):.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the app's cold-start import time.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to start (default: %(default)s)")
+    parser.add_argument("--preload", action="store_true", help="Measure with APP_PRELOAD=1")
+    parser.add_argument("--output", default="bench_startup.json", help="Where to write the JSON results (default: %(default)s)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results = run(args)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print_results(results, baseline)
+    print(f"Results written to {os.path.abspath(args.output)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import sys
+import os
+import argparse
+
+# Add the project root to sys.path so 'app' can be imported
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.db import DB_FILE, DB_SHARD_DIR, JsonDB
+from app.snapshot import FORMATS
+
+def import_sqlite(args):
+    from app.sqlite_db import SQLiteDB
+    from app.wal import read_database
+
+    # Includes records the wal engine has not compacted into the snapshot yet
+    data = read_database(args.source)
+    counts = SQLiteDB(args.dest).import_data(data)
+    for name, count in counts.items():
+        print(f"{name}: imported {count} of {len(data[name])} documents")
+
+def split_db(args):
+    from app.sharded import split
+
+    for name, count in split(args.source, args.dest).items():
+        print(f"{name}: {count} documents")
+    print(f"Run with DB_ENGINE=sharded DB_SHARD_DIR={args.dest} to use it")
+
+def convert_format(args):
+    # A shard directory is converted one collection file at a time
+    paths = [args.path]
+    if os.path.isdir(args.path):
+        paths = sorted(os.path.join(args.path, f) for f in os.listdir(args.path) if f.endswith('.json'))
+    for path in paths:
+        db = JsonDB(path, cache=False, snapshot_format=args.format)
+        with db.lock.acquire():
+            before = os.path.getsize(path)
+            db.write(db.read())
+        print(f"{path}: {before} -> {os.path.getsize(path)} bytes ({args.format})")
+
+def rebuild_analytics(args):
+    from app.analytics import rebuild
+    from app.db import open_db
+
+    # Same database the app uses (MONGO_URI / DB_ENGINE)
+    count = rebuild(open_db())
+    print(f"Rebuilt analytics from {count} reports")
+
+def requeue_jobs(args):
+    from app.db import open_db
+    from app.models import Job
+
+    count = Job.requeue_failed(open_db(), args.kind)
+    print(f"Requeued {count} failed jobs; the app's workers will pick them up")
+
+def main():
+    parser = argparse.ArgumentParser(description="Database maintenance commands.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    cmd = commands.add_parser("import-sqlite", help="Copy a database.json into a SQLite database.")
+    cmd.add_argument("dest", help="SQLite file to create or add to (use it as MONGO_URI=sqlite:///<dest>)")
+    cmd.add_argument("--source", default=DB_FILE, help="JSON database to read (default: %(default)s)")
+    cmd.set_defaults(func=import_sqlite)
+
+    cmd = commands.add_parser("split-db", help="Copy a database.json into one file per collection.")
+    cmd.add_argument("--source", default=DB_FILE, help="JSON database to read (default: %(default)s)")
+    cmd.add_argument("--dest", default=DB_SHARD_DIR, help="Directory for the collection files (default: %(default)s)")
+    cmd.set_defaults(func=split_db)
+
+    cmd = commands.add_parser("convert-format", help="Rewrite a local database in JSON or binary snapshot format.")
+    cmd.add_argument("format", choices=FORMATS, help="Format to write (set DB_FORMAT to match)")
+    cmd.add_argument("--path", default=DB_FILE, help="Database file or shard directory (default: %(default)s)")
+    cmd.set_defaults(func=convert_format)
+
+    cmd = commands.add_parser("rebuild-analytics", help="Recompute the HR analytics aggregates from all reports.")
+    cmd.set_defaults(func=rebuild_analytics)
+
+    cmd = commands.add_parser("requeue-jobs", help="Retry failed background jobs (e.g. reports lost to a quota outage).")
+    cmd.add_argument("--kind", help="Only jobs of this kind, e.g. report")
+    cmd.set_defaults(func=requeue_jobs)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
@@ -11,9 +11,9 @@ def test_hr_dashboard_logic():
     print("Testing HR Dashboard logic...")
     db = get_db()
     
-    # Test InterviewReport.get_all (The part that was crashing)
+    # Test InterviewReport.page (The part that was crashing)
     try:
-        reports = InterviewReport.get_all(db)
+        reports, _ = InterviewReport.page(db)
         print(f"Successfully fetched {len(reports)} reports.")
         if len(reports) > 1:
             # Check if sorted correctly (latest first)
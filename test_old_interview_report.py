@@ -0,0 +1,53 @@
+import sys
+import os
+import tempfile
+import time
+
+# Add the project root to sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+def test_old_interview_report():
+    """An interview saved with an inline "history" array still gets its report."""
+    print("Testing report for an interview stored in the old format...")
+    # Throwaway database and the offline model; set before the app is imported
+    os.chdir(tempfile.mkdtemp())
+    os.environ["LLM_PROVIDER"] = "fake"
+
+    from app.app import app
+    from app.db import get_db
+
+    client = app.test_client()
+    client.post('/register', data={"name": "S", "email": "old@x.com", "password": "pw"})
+    client.post('/login', data={"email": "old@x.com", "password": "pw"})
+
+    db = get_db()
+    student = db.users.find_one({"email": "old@x.com"})
+    db.active_interviews.insert_one({
+        "student_id": str(student["_id"]),
+        "history": [
+            {"role": "user", "parts": ["You are a professional AI Interviewer.\n\nResume Context:\nPython dev"]},
+            {"role": "model", "parts": ['{"feedback": "", "question": "Tell me about yourself."}']},
+            {"role": "user", "parts": ["I write Python."]}
+        ],
+        "updated_at": "now",
+        "_rev": 0
+    })
+
+    res = client.post('/api/interview/end')
+    assert res.status_code == 200, res.data
+    job_id = res.get_json()["job_id"]
+
+    status = None
+    for _ in range(100):
+        status = client.get(f'/api/jobs/{job_id}').get_json()
+        if status["status"] in ("done", "failed"):
+            break
+        time.sleep(0.1)
+    assert status["status"] == "done", status
+    assert db.reports.find_one({"_id": job_id}) is not None
+
+    print("Old-format interview report verified successfully!")
+
+if __name__ == "__main__":
+    test_old_interview_report()
+    sys.exit(0)